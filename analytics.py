@@ -0,0 +1,198 @@
+from array import array
+from dataclasses import dataclass
+from typing import Tuple
+
+from fuzzy import FuzzyIndex
+
+# Derived stats over the MATCHES tab, computed once per refresh for $stats and
+# $h2h. Played games (both scores filled in) are first laid out as flat column
+# arrays, one entry per game and one per player line, then each stat is a
+# single pass over those columns; commands only read the finished records.
+
+FORM_GAMES = 5  # results shown as recent form
+
+
+@dataclass(frozen=True, slots=True)
+class PlayerStats:
+    name: str
+    team: str
+    games: int
+    goals: int
+    assists: int
+
+    @property
+    def goals_per_game(self):
+        return self.goals / self.games if self.games else 0.0
+
+    @property
+    def assists_per_game(self):
+        return self.assists / self.games if self.games else 0.0
+
+
+@dataclass(frozen=True, slots=True)
+class TeamResult:
+    opponent: str
+    goals_for: int
+    goals_against: int
+
+    @property
+    def outcome(self):
+        if self.goals_for > self.goals_against:
+            return "W"
+        return "D" if self.goals_for == self.goals_against else "L"
+
+
+@dataclass(frozen=True, slots=True)
+class TeamStats:
+    name: str
+    results: Tuple[TeamResult, ...]  # every played game, in sheet order
+    w: int
+    d: int
+    l: int
+    gf: int
+    ga: int
+
+    @property
+    def games(self):
+        return len(self.results)
+
+    def form(self, n=FORM_GAMES):
+        """Outcomes of the last ``n`` games, oldest first, e.g. 'WWDLW'"""
+        return "".join(r.outcome for r in self.results[-n:])
+
+
+@dataclass(frozen=True, slots=True)
+class HeadToHead:
+    team1: str
+    team2: str
+    results: Tuple[Tuple[int, int], ...]  # (team1 goals, team2 goals) per game
+    wins1: int
+    draws: int
+    wins2: int
+    goals1: int
+    goals2: int
+
+
+class MatchColumns:
+    """Played games of the MATCHES tab as column arrays of integer ids and counts"""
+
+    def __init__(self, games, key):
+        self.team_names, self.player_names, self.player_team = [], [], array("i")
+        team_ids, player_ids = {}, {}
+
+        def team_id(name):
+            k = key(name)
+            if k not in team_ids:
+                team_ids[k] = len(self.team_names)
+                self.team_names.append(name)
+            return team_ids[k]
+
+        def player_id(name, team):
+            k = key(name)
+            if k not in player_ids:
+                player_ids[k] = len(self.player_names)
+                self.player_names.append(name)
+                self.player_team.append(team)
+            return player_ids[k]
+
+        # One entry per played game
+        self.team1, self.team2 = array("i"), array("i")
+        self.score1, self.score2 = array("i"), array("i")
+        # One entry per filled-in player line
+        self.line_player, self.line_goals, self.line_assists = array("i"), array("i"), array("i")
+
+        for game in games:
+            if not game.team1 or not game.team2 or game.score1 is None or game.score2 is None:
+                continue
+            t1, t2 = team_id(game.team1), team_id(game.team2)
+            self.team1.append(t1)
+            self.team2.append(t2)
+            self.score1.append(game.score1)
+            self.score2.append(game.score2)
+            for team, lines in ((t1, game.lines1), (t2, game.lines2)):
+                for line in lines:
+                    if line.player:
+                        self.line_player.append(player_id(line.player, team))
+                        self.line_goals.append(line.goals or 0)
+                        self.line_assists.append(line.assists or 0)
+        self.team_ids = team_ids
+        self.player_ids = player_ids
+
+
+class MatchAnalytics:
+    """Per-player, per-team and head-to-head stats for one version of the MATCHES tab"""
+    __slots__ = ("players", "teams", "head_to_head", "names", "_key")
+
+    def __init__(self, games, key):
+        self._key = key
+        cols = MatchColumns(games, key)
+
+        # Players: games, goals and assists summed per player id
+        n = len(cols.player_names)
+        played, goals, assists = [0] * n, [0] * n, [0] * n
+        for pid, g, a in zip(cols.line_player, cols.line_goals, cols.line_assists):
+            played[pid] += 1
+            goals[pid] += g
+            assists[pid] += a
+        self.players = {
+            k: PlayerStats(cols.player_names[pid], cols.team_names[cols.player_team[pid]],
+                           played[pid], goals[pid], assists[pid])
+            for k, pid in cols.player_ids.items()
+        }
+
+        # Teams and head-to-head: one pass over the per-game columns
+        results = [[] for _ in cols.team_names]
+        pairs = {}
+        names = cols.team_names
+        for t1, t2, s1, s2 in zip(cols.team1, cols.team2, cols.score1, cols.score2):
+            results[t1].append(TeamResult(names[t2], s1, s2))
+            results[t2].append(TeamResult(names[t1], s2, s1))
+            if t1 > t2:
+                t1, t2, s1, s2 = t2, t1, s2, s1
+            pairs.setdefault((t1, t2), []).append((s1, s2))
+
+        self.teams = {}
+        for k, tid in cols.team_ids.items():
+            rs = results[tid]
+            outcomes = [r.outcome for r in rs]
+            self.teams[k] = TeamStats(
+                names[tid], tuple(rs),
+                w=outcomes.count("W"), d=outcomes.count("D"), l=outcomes.count("L"),
+                gf=sum(r.goals_for for r in rs), ga=sum(r.goals_against for r in rs),
+            )
+
+        self.head_to_head = {}
+        for (t1, t2), scores in pairs.items():
+            self.head_to_head[frozenset((key(names[t1]), key(names[t2])))] = HeadToHead(
+                names[t1], names[t2], tuple(scores),
+                wins1=sum(s1 > s2 for s1, s2 in scores),
+                draws=sum(s1 == s2 for s1, s2 in scores),
+                wins2=sum(s1 < s2 for s1, s2 in scores),
+                goals1=sum(s1 for s1, _ in scores),
+                goals2=sum(s2 for _, s2 in scores),
+            )
+
+        # Players and teams share one namespace for $stats lookups
+        self.names = FuzzyIndex([(k, s.name) for k, s in self.players.items()]
+                                + [(k, s.name) for k, s in self.teams.items()])
+
+    def lookup(self, name):
+        """PlayerStats or TeamStats for an exact name or unique prefix; teams win a tie"""
+        k = self._key(name)
+        if k not in self.teams and k not in self.players:
+            k = self.names.resolve(k)
+        return (self.teams.get(k) or self.players.get(k)) if k else None
+
+    def suggest(self, name, limit=3):
+        return self.names.suggest(self._key(name), limit)
+
+    def h2h(self, team1, team2):
+        """HeadToHead with ``team1`` first, or None when they have not played"""
+        record = self.head_to_head.get(frozenset((self._key(team1), self._key(team2))))
+        if record is None or self._key(record.team1) == self._key(team1):
+            return record
+        return HeadToHead(
+            record.team2, record.team1, tuple((s2, s1) for s1, s2 in record.results),
+            wins1=record.wins2, draws=record.draws, wins2=record.wins1,
+            goals1=record.goals2, goals2=record.goals1,
+        )
@@ -0,0 +1,143 @@
+"""Offline micro-benchmarks for parsing, lookups and rendering.
+
+Runs every command's parse, lookup and render stage in isolation against
+synthetic sheets (no Discord, no network) and prints the results as JSON.
+
+    python bench.py                                 # default sizes
+    python bench.py --sizes 9x4 200x8 1000x10       # teams x players per team
+    python bench.py --output bench.json --compare previous.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+import render
+from sheets import parse_csv
+from synthetic import make_sheets, to_csv
+from tournament import PARSERS, SPECS, Snapshot, name_key
+
+TABS = ("PLAYERS", "GROUP_STAGE", "MATCHES")
+
+
+def measure(fn, repeat):
+    """Seconds per call: median and best of ``repeat`` auto-ranged samples"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    samples = [t / number for t in timer.repeat(repeat, number)]
+    return {"median": statistics.median(samples), "min": min(samples), "loops": number}
+
+
+def bench_size(teams, players_per_team, matchups, repeat):
+    sheets = make_sheets(teams, players_per_team, matchups)
+    results = {}
+
+    # ---- Parse: projected CSV decode and table build per tab ----
+    tables = {}
+    for tab in TABS:
+        body, spec = to_csv(sheets[tab]), SPECS[tab]
+        rows = parse_csv(body, spec)
+        tables[tab] = PARSERS[tab](rows)
+        results[f"parse.{tab}.csv"] = measure(lambda: parse_csv(body, spec), repeat)
+        results[f"parse.{tab}.build"] = measure(lambda: PARSERS[tab](rows), repeat)
+        results[f"parse.{tab}.bytes"] = len(body)
+
+    snap = Snapshot(tables["PLAYERS"], tables["GROUP_STAGE"], tables["MATCHES"], version=1)
+
+    # Worst cases for a linear scan: the last player, team and matchup on the sheet
+    last_player = snap.players.players[-1]
+    last_game = next(g for g in reversed(snap.matches.games) if g.team1)
+    name, team = last_player.name.upper(), last_player.team.lower()
+    team1, team2 = last_game.team2, last_game.team1
+    typo = name[:-2] + "x" + name[-1:]  # one substitution: goes through the fuzzy index
+
+    # ---- Lookup and render per command ----
+    cases = {
+        "player": (lambda: snap.players.find(name), lambda: render.player(snap, name)),
+        "player_typo": (lambda: snap.players.suggest(typo), lambda: render.player(snap, typo)),
+        "team": (lambda: (snap.players.roster(team), snap.standings.find(team)), lambda: render.team(snap, team)),
+        "standings": (lambda: snap.standings.ranked[:20], lambda: render.standings(snap, 1, 20)),
+        "topscorers": (lambda: snap.players.top_scorers[:10], lambda: render.topscorers(snap, 1, 10)),
+        "assists": (lambda: snap.players.top_assists[:10], lambda: render.assists(snap, 1, 10)),
+        "matchlink": (lambda: snap.matches.find(team1, team2), lambda: render.matchlink(snap, team1, team2)),
+        "matchinfo": (lambda: snap.matches.find(team1, team2), lambda: render.matchinfo(snap, team1, team2)),
+        "stats": (lambda: snap.matches.analytics.lookup(team1), lambda: render.stats(snap, team1)),
+        "h2h": (lambda: snap.matches.analytics.h2h(team1, team2), lambda: render.h2h(snap, team1, team2)),
+    }
+    for command, (lookup, renderer) in cases.items():
+        results[f"{command}.lookup"] = measure(lookup, repeat)
+        results[f"{command}.render"] = measure(renderer, repeat)
+
+    # ---- Slash-command autocomplete: prefix of a name, and a typo ----
+    results["autocomplete.prefix"] = measure(lambda: snap.players.names.complete(name_key(name[:3])), repeat)
+    results["autocomplete.typo"] = measure(lambda: snap.players.names.complete(name_key(typo)), repeat)
+
+    return results
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(current, previous):
+    """Prints median ratios (current / previous) for every shared benchmark"""
+    for size, results in current["sizes"].items():
+        old = previous.get("sizes", {}).get(size)
+        if not old:
+            continue
+        for name, stats in results.items():
+            before = old.get(name)
+            if not isinstance(stats, dict) or not isinstance(before, dict) or not before["median"]:
+                continue
+            ratio = stats["median"] / before["median"]
+            flag = "  <-- slower" if ratio > 1.2 else ""
+            print(f"{size:>12} {name:<28} {ratio:6.2f}x{flag}", file=sys.stderr)
+
+
+def parse_size(text):
+    teams, _, players = text.partition("x")
+    return int(teams), int(players or 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["9x4", "100x8", "500x10"],
+                        help="tournament sizes as TEAMSxPLAYERS_PER_TEAM")
+    parser.add_argument("--matchups", type=int, default=None,
+                        help="matchups on the MATCHES tab (default: 2 per team)")
+    parser.add_argument("--repeat", type=int, default=3, help="samples per benchmark")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "sizes": {},
+    }
+    for size in args.sizes:
+        teams, players = parse_size(size)
+        print(f"Benchmarking {teams} teams x {players} players...", file=sys.stderr)
+        report["sizes"][f"{teams}x{players}"] = bench_size(teams, players, args.matchups, args.repeat)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
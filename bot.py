@@ -7,37 +7,144 @@ logging.basicConfig(
 )
 import os
 import json
+import asyncio
 import discord
+from discord import app_commands
 from discord.ext import commands
 from threading import Thread
-from time import time, sleep
-import requests
-
-# We'll use a hybrid approach - try gspread first, fall back to direct CSV
-class PublicSheet:
-    def __init__(self, sheet_id):
-        self.sheet_id = sheet_id
-        
-    def get_worksheet(self, sheet_name):
-        """Get worksheet data as list of lists"""
-        url = f"https://docs.google.com/spreadsheets/d/{self.sheet_id}/gviz/tq?tqx=out:csv&sheet={sheet_name}"
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        # Parse CSV
-        import csv
-        from io import StringIO
-        
-        csv_data = StringIO(response.text)
-        reader = csv.reader(csv_data)
-        return list(reader)
+from time import time, sleep, perf_counter
+import metrics
+from governor import Busy, Governor
+from history import HistoryFormatError, HistoryLog, parse_when, player_series, standings_changes, when_length
+from live import LiveBoards
+from looplag import LoopLagMonitor
+from sheets import PublicSheet, RowDiff, SheetCache
+import render
+from refresher import Refresher
+from render import RenderCache
+from shared import SharedSnapshot
+from standings import StandingsEngine
+from store import SnapshotSaver, restore_cache
+from tournament import PARSERS, SPECS, Snapshot, StandingsTable, TournamentData, name_key
 
 # Initialize public sheet access
 SHEET_ID = os.environ.get("SHEET_ID")
 if not SHEET_ID:
     raise RuntimeError("SHEET_ID not set")
 
-public_sheet = PublicSheet(SHEET_ID)
+# Per-request timeout (seconds) and how many sheet downloads may run at once
+SHEET_TIMEOUT = float(os.environ.get("SHEET_TIMEOUT", 10))
+SHEET_MAX_CONCURRENCY = int(os.environ.get("SHEET_MAX_CONCURRENCY", 8))
+
+# SHEET_URL points the bot at another gviz-compatible endpoint (e.g. standin.py).
+# SHEET_PUSHDOWN=0 always downloads whole tabs and filters them locally.
+public_sheet = PublicSheet(
+    SHEET_ID,
+    timeout=SHEET_TIMEOUT,
+    max_concurrency=SHEET_MAX_CONCURRENCY,
+    url=os.environ.get("SHEET_URL"),
+    pushdown=os.environ.get("SHEET_PUSHDOWN", "1").lower() not in ("0", "false", "no"),
+)
+
+# How long (seconds) each tab is served from memory before it is revalidated.
+# Override per tab with e.g. PLAYERS_TTL=30
+SHEET_TTLS = {
+    "PLAYERS": int(os.environ.get("PLAYERS_TTL", 60)),
+    "GROUP_STAGE": int(os.environ.get("GROUP_STAGE_TTL", 60)),
+    "MATCHES": int(os.environ.get("MATCHES_TTL", 120)),
+}
+
+# After a failed refresh (Google down, 429) the stale copy is served for another
+# SHEET_ERROR_TTL seconds before retrying, doubling per failure up to the tab's TTL.
+sheet_cache = SheetCache(public_sheet, ttls=SHEET_TTLS, parsers=PARSERS, specs=SPECS,
+                         error_ttl=float(os.environ.get("SHEET_ERROR_TTL", 5)))
+
+# Standings come from the GROUP_STAGE tab. STANDINGS_SOURCE=matches computes them
+# from the results on MATCHES instead, applying only the rows that changed on each
+# refresh, and checks GROUP_STAGE against them (see bot_standings_mismatches):
+# only switch once that stays at 0 on the real sheet.
+# STANDINGS_TIEBREAKERS orders what breaks a tie on points: gd, gf, h2h and w.
+if os.environ.get("STANDINGS_SOURCE", "sheet").lower() != "matches":
+    standings_engine = None
+else:
+    standings_engine = StandingsEngine(
+        sheet_cache,
+        tiebreakers=[t.strip() for t in os.environ.get("STANDINGS_TIEBREAKERS", "gd,gf,h2h").split(",") if t.strip()],
+    )
+    sheet_cache.add_listener(standings_engine)
+
+# Parsed snapshot of every tab shared by all commands
+tournament = TournamentData(sheet_cache, standings=standings_engine)
+STANDINGS_TAB = tournament.standings_tab
+
+# Last good copy of every tab, kept on disk so a restart (or a Google outage)
+# still has data to serve. Loaded by load_saved_snapshot() before bot.run.
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "snapshot.bin")
+snapshot_saver = SnapshotSaver(sheet_cache, SNAPSHOT_PATH, delay=float(os.environ.get("SNAPSHOT_SAVE_DELAY", 5)))
+
+# SHARED_SNAPSHOT=1 lets several bot processes on one box share that file: the one
+# holding SNAPSHOT_PATH.lock fetches from Google and publishes every change, the
+# others read the file instead and take over if the leader exits.
+if os.environ.get("SHARED_SNAPSHOT", "").lower() in ("1", "true", "yes"):
+    shared_snapshot = SharedSnapshot(sheet_cache, public_sheet, snapshot_saver, SNAPSHOT_PATH)
+else:
+    shared_snapshot = None
+    sheet_cache.add_listener(snapshot_saver)
+
+# Every change to every tab is appended to HISTORY_PATH for $history. Rebuilding
+# a past moment reads one full copy of the tab plus at most
+# HISTORY_CHECKPOINT_EVERY changes. Processes sharing the file take turns
+# writing it: the first to open it writes, the others only read until it exits.
+# HISTORY_PATH= (empty) turns the log off.
+HISTORY_PATH = os.environ.get("HISTORY_PATH", "history.log")
+history_log = None
+if HISTORY_PATH:
+    try:
+        history_log = HistoryLog(
+            sheet_cache, HISTORY_PATH,
+            checkpoint_every=int(os.environ.get("HISTORY_CHECKPOINT_EVERY", 50)),
+        ).open()
+        sheet_cache.add_listener(history_log)
+    except (OSError, HistoryFormatError) as e:
+        logging.warning(f"History log disabled: {e}")
+        history_log = None
+
+def load_saved_snapshot():
+    """Seeds the sheet cache from the snapshot file, if there is a usable one"""
+    return restore_cache(sheet_cache, SNAPSHOT_PATH)
+
+# Keeps every tab warm in the background so commands rarely wait on Google.
+# Tabs are refreshed every TTL/2 while commands are coming in and back off when idle.
+refresher = Refresher(
+    sheet_cache,
+    intervals=SHEET_TTLS,
+    active_window=int(os.environ.get("REFRESH_ACTIVE_WINDOW", 300)),
+    max_interval=int(os.environ.get("REFRESH_MAX_INTERVAL", 900)),
+)
+
+# Rendered replies, reused until the next snapshot version lands
+render_cache = RenderCache(
+    max_entries=int(os.environ.get("RENDER_CACHE_ENTRIES", 512)),
+    max_bytes=int(os.environ.get("RENDER_CACHE_BYTES", 2_000_000)),
+)
+
+# Admission control: identical commands in flight share one execution, and at most
+# COMMAND_MAX_CONCURRENCY run at once (COMMAND_MAX_PER_GUILD per server). Commands
+# that cannot get a slot within COMMAND_QUEUE_TIMEOUT seconds get a busy reply.
+governor = Governor(
+    max_concurrent=int(os.environ.get("COMMAND_MAX_CONCURRENCY", 16)),
+    per_guild=int(os.environ.get("COMMAND_MAX_PER_GUILD", 4)),
+    max_queue=int(os.environ.get("COMMAND_MAX_QUEUE", 64)),
+    queue_timeout=float(os.environ.get("COMMAND_QUEUE_TIMEOUT", 3)),
+)
+
+# Samples event-loop lag for /metrics and reports which command blocked the loop.
+# LOOP_DEBUG=1 also logs the stack of every blocking call made from a command.
+lag_monitor = LoopLagMonitor(
+    interval=float(os.environ.get("LOOP_LAG_INTERVAL", 0.5)),
+    stall_threshold=float(os.environ.get("LOOP_STALL_THRESHOLD", 0.25)),
+    debug=os.environ.get("LOOP_DEBUG", "").lower() in ("1", "true", "yes"),
+)
 
 # -------------------- Discord Bot Setup --------------------
 TOKEN = os.environ.get("DISCORD_TOKEN")
@@ -46,15 +153,84 @@ if not TOKEN:
 
 # Only enable basic intents, no privileged ones
 intents = discord.Intents.default()
-intents.message_content = True  # Needed to read message content
+intents.message_content = True  # Needed for the $ text commands; slash commands work without it
+
+# SHARD_COUNT=4 SHARD_IDS=0,1 runs shards 0 and 1 of 4 in this process
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", 0))
+shard_options = {}
+if SHARD_COUNT:
+    shard_options["shard_count"] = SHARD_COUNT
+    if os.environ.get("SHARD_IDS"):
+        shard_options["shard_ids"] = [int(i) for i in os.environ["SHARD_IDS"].split(",")]
+
+# Slash versions of the commands are registered with Discord on startup. With
+# several processes (SHARD_IDS), set SYNC_SLASH_COMMANDS=0 on all but one.
+SYNC_SLASH_COMMANDS = os.environ.get("SYNC_SLASH_COMMANDS", "1").lower() in ("1", "true", "yes")
+
+class TournamentBot(commands.AutoShardedBot if SHARD_COUNT else commands.Bot):
+    async def setup_hook(self):
+        if SYNC_SLASH_COMMANDS:
+            synced = await self.tree.sync()
+            logging.info(f"Synced {len(synced)} slash commands")
+
+    async def close(self):
+        # Stop background refreshes and release the pooled sheet session
+        await refresher.stop()
+        await lag_monitor.stop()
+        if shared_snapshot is not None:
+            await shared_snapshot.stop()
+        if history_log is not None:
+            history_log.close()
+        await public_sheet.close()
+        await super().close()
 
 # ✅ Create the bot object here
-bot = commands.Bot(command_prefix="$", intents=intents)
+bot = TournamentBot(command_prefix="$", intents=intents, **shard_options)
+
+# Live messages ($live) that edit themselves when the standings or PLAYERS change.
+# Changes are batched for LIVE_UPDATE_DELAY seconds before the messages are edited.
+# With several processes (SHARD_IDS), give each its own LIVE_PATH.
+LIVE_BOARDS = {
+    "standings": (STANDINGS_TAB, render.standings),
+    "topscorers": ("PLAYERS", render.topscorers),
+    "assists": ("PLAYERS", render.assists),
+}
+LIVE_DEFAULT_LIMITS = {"standings": 20, "topscorers": 10, "assists": 10}
+live_boards = LiveBoards(
+    bot, tournament, LIVE_BOARDS,
+    path=os.environ.get("LIVE_PATH", "live.json"),
+    delay=float(os.environ.get("LIVE_UPDATE_DELAY", 10)),
+)
+live_boards.load()
+sheet_cache.add_listener(live_boards)
+
+# -------------------- Metrics --------------------
+metrics.watch_cache("sheets", sheet_cache.stats,
+                    hit_events=("hits", "stale"), lookup_events=("hits", "stale", "misses"))
+metrics.watch_cache("render", render_cache.stats)
+metrics.REGISTRY.add_collector(lambda: metrics.GATEWAY_LATENCY.set(bot.latency))
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = perf_counter()
+    lag_monitor.command_started(ctx.command.qualified_name)
+
+@bot.after_invoke
+async def record_command_latency(ctx):
+    lag_monitor.command_finished()
+    metrics.COMMAND_LATENCY.observe(perf_counter() - ctx.started_at, command=ctx.command.qualified_name)
 
 # -------------------- Event Handlers --------------------
 @bot.event
 async def on_ready():
     logging.info(f"Bot connected as {bot.user}")
+    # All of these are no-ops when on_ready fires again after a reconnect
+    if shared_snapshot is not None:
+        shared_snapshot.start()
+    refresher.start()
+    live_boards.start()
+    lag_monitor.watch_commands(bot.walk_commands())
+    lag_monitor.start()
 
 @bot.event
 async def on_disconnect():
@@ -72,6 +248,10 @@ async def on_error(event, *args, **kwargs):
 async def on_command_error(ctx, error):
     if isinstance(error, commands.CommandNotFound):
         return  # silently ignore unknown commands
+    if not isinstance(error, commands.CheckFailure):  # random fails are counted in the check
+        original = getattr(error, "original", error)
+        metrics.COMMAND_ERRORS.inc(command=ctx.command.qualified_name if ctx.command else "",
+                                   type=type(original).__name__)
     raise error  # let other errors bubble up
 
 
@@ -100,6 +280,7 @@ async def global_random_fail(ctx):
 
     # 1% chance of error for everyone else
     if random.randint(1, 100) == 1:
+        metrics.COMMAND_ERRORS.inc(command=ctx.command.qualified_name, type="global_random_fail")
         # If the user has a custom error, use it
         if ctx.author.id in custom_errors:
             await ctx.send(custom_errors[ctx.author.id])
@@ -113,6 +294,107 @@ async def global_random_fail(ctx):
 
 
 
+# -------------------- Paging --------------------
+# Leaderboard commands accept "[page] [--limit N]", e.g. "$topscorers 2 --limit 15"
+MAX_PAGE_SIZE = 25
+
+def parse_page_args(args, default_limit):
+    """Parses leaderboard arguments into (page, limit). Raises ValueError on bad input."""
+    page, limit = 1, default_limit
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--limit":
+            if not args:
+                raise ValueError("--limit needs a number")
+            limit = int(args.pop(0))
+        elif arg.startswith("--limit="):
+            limit = int(arg.split("=", 1)[1])
+        else:
+            page = int(arg)
+    if page < 1 or limit < 1:
+        raise ValueError("page and limit must be positive")
+    return page, min(limit, MAX_PAGE_SIZE)
+
+# -------------------- Replies --------------------
+BUSY_REPLY = "⏳ Lots of requests right now, please try again in a few seconds."
+
+# Slash commands must be answered within 3 seconds; a reply that is not ready
+# after SLASH_DEFER_AFTER seconds (e.g. waiting on Google) is deferred first,
+# which shows "thinking..." and allows up to 15 minutes for the real answer.
+SLASH_DEFER_AFTER = float(os.environ.get("SLASH_DEFER_AFTER", 1.5))
+
+async def respond(ctx, command, args, sheet_names, renderer):
+    """Sends the rendered reply for a command, rendering it only once per snapshot version.
+
+    ``args`` is the normalized form of the arguments used as the cache and
+    single-flight key; ``renderer`` builds the text from a Snapshot. The reply
+    is shared by everyone asking with the same key, so the renderer must only
+    see the normalized arguments, never one user's spelling of them.
+    """
+    refresher.note_activity()
+
+    async def build():
+        snap = await tournament.snapshot(*sheet_names)
+        msg = render_cache.get(command, args, snap.version)
+        if msg is None:
+            msg = renderer(snap)
+            render_cache.put(command, args, snap.version, msg)
+        return msg
+
+    await send_governed(ctx, command, args, build)
+
+async def send_governed(ctx, command, args, build):
+    """Sends ``await build()``, run through the governor under the (command, args) key"""
+    async def tracked():
+        # The governor runs build in a task of its own, away from the command
+        # callback: register that task so a stall in it is still blamed on the command
+        lag_monitor.command_started(command)
+        try:
+            return await build()
+        finally:
+            lag_monitor.command_finished()
+
+    try:
+        reply = asyncio.ensure_future(governor.run(command, args, ctx.guild.id if ctx.guild else None, tracked))
+        if ctx.interaction is not None:
+            done, _ = await asyncio.wait({reply}, timeout=SLASH_DEFER_AFTER)
+            if not done:
+                await ctx.defer()
+        try:
+            msg = await reply
+        except Busy:
+            await ctx.send(BUSY_REPLY)
+            return
+        await ctx.send(msg)
+    except Exception as e:
+        metrics.COMMAND_ERRORS.inc(command=command, type=type(e).__name__)
+        raise
+
+# -------------------- Autocomplete --------------------
+# Suggestions for slash-command arguments come straight from the name indexes of
+# the tables already in memory: no download, no queue, so each answer takes well
+# under a millisecond. Before the first load of a tab there is nothing to offer.
+MAX_CHOICES = 25  # Discord's limit
+
+def complete(option, index, current):
+    started = perf_counter()
+    names = index.complete(name_key(current), MAX_CHOICES) if index is not None else []
+    metrics.AUTOCOMPLETE_LATENCY.observe(perf_counter() - started, option=option)
+    return [app_commands.Choice(name=name[:100], value=name[:100]) for name in names]
+
+async def complete_player(interaction, current):
+    players = sheet_cache.peek("PLAYERS")
+    return complete("player", players.names if players else None, current)
+
+async def complete_team(interaction, current):
+    players = sheet_cache.peek("PLAYERS")
+    return complete("team", players.teams if players else None, current)
+
+async def complete_stats(interaction, current):
+    matches = sheet_cache.peek("MATCHES")
+    return complete("stats", matches.analytics.names if matches else None, current)
+
 # Ping command
 @bot.command(name="ping")
 async def ping(ctx):
@@ -120,428 +402,240 @@ async def ping(ctx):
     latency_ms = round(bot.latency * 1000)
     await ctx.send(f"Pong! Latency: {latency_ms}ms")
 
-@bot.command(name="player")
+@bot.hybrid_command(name="player")
+@app_commands.describe(name="Player name or the start of it")
+@app_commands.autocomplete(name=complete_player)
 async def player(ctx, *, name: str):
     """Displays stats for a specific player from the PLAYERS sheet."""
     try:
-        # Get worksheet data
-        all_rows = public_sheet.get_worksheet("PLAYERS")
-        
-        # Headers are on row 4 (index 3), data starts at row 5 (index 4)
-        headers = all_rows[3]
-        data_rows = all_rows[4:]
-
-        # Column indexes (0-based)
-        # C4: Players (index 2), E4: TEAM (index 4), F4: GP (index 5), J4: G (index 9), K4: A (index 10)
-        player_idx = 2  # Column C
-        team_idx = 4    # Column E
-        gp_idx = 5      # Column F
-        goals_idx = 9   # Column J
-        assists_idx = 10 # Column K
-
-        # Find the player's row (case-insensitive match)
-        player_row = None
-        for row in data_rows:
-            if len(row) > player_idx and row[player_idx].strip().lower() == name.lower():
-                player_row = row
-                break
-
-        if not player_row:
-            await ctx.send(f"❌ Player '{name}' not found.")
-            return
-
-        # Get values with safe indexing
-        player_name = player_row[player_idx] if len(player_row) > player_idx else "Unknown"
-        team = player_row[team_idx] if len(player_row) > team_idx else "Unknown"
-        gp = player_row[gp_idx] if len(player_row) > gp_idx else "0"
-        goals = player_row[goals_idx] if len(player_row) > goals_idx else "0"
-        assists = player_row[assists_idx] if len(player_row) > assists_idx else "0"
-
-        # Build stats message (simplified since we only have basic stats)
-        msg = (
-            f"**{player_name}** ({team})\n"
-            f"Games: {gp} | Goals: {goals} | Assists: {assists}"
-        )
-
-        await ctx.send(msg)
-
+        key = name_key(name)
+        await respond(ctx, "player", (key,), ("PLAYERS",),
+                      lambda snap: render.player(snap, key))
     except Exception as e:
         await ctx.send(f"⚠️ Error fetching player data: {e}")
 
 @bot.command(name="standings")
-async def standings(ctx):
-    """Shows the tournament standings of every team sorted by points."""
+async def standings(ctx, *args):
+    """Shows the tournament standings of every team sorted by points. Usage: $standings [page] [--limit N]"""
     try:
-        all_rows = public_sheet.get_worksheet("GROUP_STAGE")
-        
-        # Based on your debug output, the real data is in rows 1-9 (0-indexed)
-        # Row 0 has headers, rows 1-9 have the actual team data
-        headers = all_rows[0]  # Row 0 is the header row
-        data = all_rows[1:10]  # Rows 1-9 (9 rows of team data)
-        
-        # Column mappings from your sheet:
-        # C: Team (index 2)
-        # E: GP (index 4)
-        # F: W (index 5)
-        # G: D (index 6)
-        # H: L (index 7)
-        # J: GF (index 9)
-        # K: GA (index 10)
-        
-        # Parse data
-        parsed = []
-        for row in data:
-            if len(row) < 11:  # Need at least 11 columns for GA (index 10)
-                continue
-                
-            team_name = row[2].strip()  # Column C
-            if not team_name or team_name.startswith("Table"):  # Skip any "Table..." rows
-                continue
-            
-            try:
-                gp = int(row[4]) if row[4].strip().isdigit() else 0   # Column E
-                w = int(row[5]) if row[5].strip().isdigit() else 0    # Column F
-                d = int(row[6]) if row[6].strip().isdigit() else 0    # Column G
-                l = int(row[7]) if row[7].strip().isdigit() else 0    # Column H
-                gf = int(row[9]) if row[9].strip().isdigit() else 0   # Column J
-                ga = int(row[10]) if row[10].strip().isdigit() else 0 # Column K
-                
-                # Calculate stats
-                gd = gf - ga
-                pts = (w * 3) + d  # Calculate points from wins and draws
-                
-                parsed.append({
-                    "team": team_name,
-                    "gp": str(gp),
-                    "w": str(w),
-                    "d": str(d),
-                    "l": str(l),
-                    "gf": str(gf),
-                    "ga": str(ga),
-                    "gd": str(gd),
-                    "pts": pts
-                })
-            except (ValueError, IndexError) as e:
-                continue  # Skip rows with invalid data
-        
-        if not parsed:
-            await ctx.send("❌ No team data found.")
-            return
-        
-        # Sort by PTS descending
-        sorted_data = sorted(parsed, key=lambda x: x["pts"], reverse=True)
-        
-        # Build leaderboard text
-        msg = "**🏆 WORLD CUP 2025 STANDINGS 🏆**\n"
-        msg += "```"
-        msg += f"{'Rank':<5}{'Team':<12}{'GP':<4}{'W':<4}{'D':<4}{'L':<4}{'GF':<4}{'GA':<4}{'GD':<5}{'PTS':<5}\n"
-        msg += "-" * 55 + "\n"
-        for i, team in enumerate(sorted_data, start=1):
-            msg += f"{i:<5}{team['team'][:10]:<12}{team['gp']:<4}{team['w']:<4}{team['d']:<4}{team['l']:<4}{team['gf']:<4}{team['ga']:<4}{team['gd']:<5}{team['pts']:<5}\n"
-        msg += "```"
-        
-        await ctx.send(msg)
-        
+        page, limit = parse_page_args(args, default_limit=20)
+    except ValueError:
+        await ctx.send("❌ Usage: `$standings [page] [--limit N]`")
+        return
+
+    try:
+        await respond(ctx, "standings", (page, limit), (STANDINGS_TAB,),
+                      lambda snap: render.standings(snap, page, limit))
     except Exception as e:
         await ctx.send(f"⚠️ Error fetching standings: {e}")
 
-@bot.command(name="team")
+@bot.hybrid_command(name="team")
+@app_commands.describe(team_name="Team name or the start of it")
+@app_commands.autocomplete(team_name=complete_team)
 async def team(ctx, *, team_name: str):
     """Shows all players from a team with stats and the team's overall totals."""
     try:
-        # Get players data
-        players_rows = public_sheet.get_worksheet("PLAYERS")
-        standings_rows = public_sheet.get_worksheet("GROUP_STAGE")
-
-        # ---- Get Player List from PLAYERS tab ----
-        # Based on your earlier format, PLAYERS tab has:
-        # C4: Players (index 2), E4: TEAM (index 4), F4: GP (index 5), J4: G (index 9), K4: A (index 10)
-        # Data starts at row 5 (index 4)
-        
-        players_data = []
-        for row in players_rows[4:]:  # Data starts at row 5
-            if len(row) < 11:  # Need at least 11 columns
-                continue
-                
-            player_team = row[4].strip() if len(row) > 4 else ""  # Column E
-            if player_team.lower() == team_name.lower():
-                player_name = row[2].strip() if len(row) > 2 else "Unknown"  # Column C
-                gp = row[5].strip() if len(row) > 5 else "0"  # Column F
-                g = row[9].strip() if len(row) > 9 else "0"   # Column J
-                a = row[10].strip() if len(row) > 10 else "0" # Column K
-                players_data.append(f"{player_name}: {gp} GP | {g} G | {a} A")
-
-        if not players_data:
-            await ctx.send(f"⚠️ No players found for **{team_name}**.")
-            return
-
-        # ---- Get Team Totals from GROUP_STAGE tab ----
-        # Data is in rows 1-9 (0-indexed), with headers in row 0
-        # C: Team (index 2), E: GP (index 4), F: W (index 5), G: D (index 6), 
-        # H: L (index 7), J: GF (index 9), K: GA (index 10)
-        
-        standings_data = standings_rows[1:10]  # Rows 1-9 (actual team data)
-        
-        totals = None
-        for row in standings_data:
-            if len(row) < 11:
-                continue
-                
-            team = row[2].strip() if len(row) > 2 else ""  # Column C
-            if team.lower() == team_name.lower():
-                gp = row[4].strip() if len(row) > 4 else "0"   # Column E
-                w = row[5].strip() if len(row) > 5 else "0"    # Column F
-                d = row[6].strip() if len(row) > 6 else "0"    # Column G
-                l = row[7].strip() if len(row) > 7 else "0"    # Column H
-                gf = row[9].strip() if len(row) > 9 else "0"   # Column J
-                ga = row[10].strip() if len(row) > 10 else "0" # Column K
-                
-                # Calculate goal difference and points
-                try:
-                    gd = int(gf) - int(ga)
-                    pts = (int(w) * 3) + int(d)
-                except ValueError:
-                    gd = 0
-                    pts = 0
-                
-                totals = {
-                    "gp": gp,
-                    "w": w,
-                    "d": d,
-                    "l": l,
-                    "gf": gf,
-                    "ga": ga,
-                    "gd": str(gd),
-                    "pts": str(pts)
-                }
-                break
-
-        # ---- Build Message ----
-        msg = f"**🏒 {team_name.upper()} TEAM SUMMARY 🏒**\n\n"
-        msg += "__Players:__\n" + "\n".join(players_data) + "\n\n"
-
-        if totals:
-            msg += "__Team Totals:__\n"
-            msg += (
-                f"**GP:** {totals['gp']} | **W:** {totals['w']} | **D:** {totals['d']} | **L:** {totals['l']}\n"
-                f"**GF:** {totals['gf']} | **GA:** {totals['ga']} | **GD:** {totals['gd']} | **PTS:** {totals['pts']}"
-            )
-        else:
-            msg += "_No team totals found in GROUP_STAGE._"
-
-        await ctx.send(msg)
-
+        key = name_key(team_name)
+        await respond(ctx, "team", (key,), ("PLAYERS", STANDINGS_TAB),
+                      lambda snap: render.team(snap, key))
     except Exception as e:
         await ctx.send(f"⚠️ Error fetching team info: {e}")
 
 @bot.command(name="topscorers")
-async def topscorers(ctx):
-    """Shows the top 10 goal scorers from the PLAYERS sheet, with GP as tiebreaker."""
+async def topscorers(ctx, *args):
+    """Shows the top goal scorers from the PLAYERS sheet, with GP as tiebreaker. Usage: $topscorers [page] [--limit N]"""
     try:
-        all_rows = public_sheet.get_worksheet("PLAYERS")
-
-        # Headers are on row 4 (index 3), data starts at row 5 (index 4)
-        headers = [h.strip().lower() for h in all_rows[3]]
-        data = all_rows[4:]
-
-        # Column indexes
-        player_idx = 2  # Column C
-        team_idx = 4    # Column E
-        gp_idx = 5      # Column F
-        g_idx = 9       # Column J
-        a_idx = 10      # Column K
-
-        # Parse players
-        parsed = []
-        for row in data:
-            if len(row) > player_idx and row[player_idx].strip():  # Only process rows with player names
-                try:
-                    goals = int(row[g_idx]) if len(row) > g_idx and row[g_idx].strip().isdigit() else 0
-                except Exception:
-                    goals = 0
-                try:
-                    gp = int(row[gp_idx]) if len(row) > gp_idx and row[gp_idx].strip().isdigit() else 0
-                except Exception:
-                    gp = 0
-                assists = row[a_idx] if len(row) > a_idx and row[a_idx].strip() else "0"
-
-                parsed.append({
-                    "player": row[player_idx] if len(row) > player_idx else "Unknown",
-                    "team": row[team_idx] if len(row) > team_idx else "Unknown",
-                    "gp": gp,
-                    "goals": goals,
-                    "assists": assists
-                })
-
-        # Sort by goals descending, then GP ascending (fewer games = higher rank)
-        sorted_players = sorted(parsed, key=lambda x: (-x["goals"], x["gp"]))
-
-        # Build leaderboard text
-        msg = "**⚽ TOP 10 GOALSCORERS ⚽**\n"
-        medals = ["🥇", "🥈", "🥉"]
-        for i, p in enumerate(sorted_players[:10], start=1):
-            rank = medals[i-1] if i <= 3 else f"{i}."
-            msg += f"{rank} {p['player']} ({p['team']}) - {p['goals']} G, {p['assists']} A, {p['gp']} GP\n"
-
-        await ctx.send(msg)
+        page, limit = parse_page_args(args, default_limit=10)
+    except ValueError:
+        await ctx.send("❌ Usage: `$topscorers [page] [--limit N]`")
+        return
 
+    try:
+        await respond(ctx, "topscorers", (page, limit), ("PLAYERS",),
+                      lambda snap: render.topscorers(snap, page, limit))
     except Exception as e:
         await ctx.send(f"⚠️ Error fetching top scorers: {e}")
 
-@bot.command(name="matchlink")
+@bot.hybrid_command(name="matchlink")
+@app_commands.describe(team1="First team", team2="Second team")
+@app_commands.autocomplete(team1=complete_team, team2=complete_team)
 async def matchlink(ctx, team1: str, team2: str):
     """Provides the video link for a match between two teams."""
     try:
-        all_rows = public_sheet.get_worksheet("MATCHES")
-
-        # Column indexes (0-based: D=3, F=5, Q=16)
-        link_idx = 3
-        team_a_idx = 5
-        team_b_idx = 16
-
-        found_row = None
-        found_data = None
-        
-        for i, row in enumerate(all_rows[1:], start=1):  # skip header
-            if len(row) > max(link_idx, team_a_idx, team_b_idx):
-                t_a = row[team_a_idx].strip().lower()
-                t_b = row[team_b_idx].strip().lower()
-                if {t_a, t_b} == {team1.lower(), team2.lower()}:
-                    found_data = row
-                    break
-
-        if found_data:
-            link = found_data[link_idx] if len(found_data) > link_idx else "No link available"
-            team_a = found_data[team_a_idx] if len(found_data) > team_a_idx else team1
-            team_b = found_data[team_b_idx] if len(found_data) > team_b_idx else team2
-
-            msg = f"🎥 {link}\nMatch: **{team_a} vs {team_b}**"
-            await ctx.send(msg)
-        else:
-            await ctx.send(f"❌ No match found for {team1} vs {team2}")
-
+        pair = tuple(sorted((name_key(team1), name_key(team2))))
+        await respond(ctx, "matchlink", pair, ("MATCHES",),
+                      lambda snap: render.matchlink(snap, *pair))
     except Exception as e:
         await ctx.send(f"⚠️ Error fetching match link: {e}")
 
-@bot.command(name="matchinfo")
+@bot.hybrid_command(name="matchinfo")
+@app_commands.describe(team1="First team", team2="Second team")
+@app_commands.autocomplete(team1=complete_team, team2=complete_team)
 async def matchinfo(ctx, team1: str, team2: str):
     """Shows a 4‑game breakdown between two teams, including players, stats, and scores."""
     try:
-        all_rows = public_sheet.get_worksheet("MATCHES")
-
-        team1_col = 5   # F
-        team2_col = 16  # Q
-
-        found_index = None
-        sheet_team1, sheet_team2 = None, None
-
-        # Find the row where these two teams meet, regardless of input order
-        for i, row in enumerate(all_rows[1:], start=1):  # skip header
-            if len(row) > max(team1_col, team2_col):
-                t1 = row[team1_col].strip().lower()
-                t2 = row[team2_col].strip().lower()
-
-                # Accept either input order
-                if {t1, t2} == {team1.lower(), team2.lower()}:
-                    found_index = i
-                    sheet_team1, sheet_team2 = row[team1_col].strip(), row[team2_col].strip()
-                    break
+        pair = tuple(sorted((name_key(team1), name_key(team2))))
+        await respond(ctx, "matchinfo", pair, ("MATCHES",),
+                      lambda snap: render.matchinfo(snap, *pair))
+    except Exception as e:
+        await ctx.send(f"⚠️ Error fetching match info: {e}")
 
-        if found_index is None:
-            await ctx.send(f"❌ No match found for {team1} vs {team2}")
-            return
+@bot.command(name="assists")
+async def assists(ctx, *args):
+    """Shows the top assist leaders from the PLAYERS sheet, with GP and goals as tiebreakers. Usage: $assists [page] [--limit N]"""
+    try:
+        page, limit = parse_page_args(args, default_limit=10)
+    except ValueError:
+        await ctx.send("❌ Usage: `$assists [page] [--limit N]`")
+        return
 
-        # Grab 4 consecutive rows (games)
-        start_idx = found_index
-        end_idx = min(found_index + 4, len(all_rows))
-        row_data = all_rows[start_idx:end_idx]
-
-        msg_lines = [f"📊 Match Info: **{sheet_team1} vs {sheet_team2}**\n"]
-        for offset, row in enumerate(row_data, start=1):
-            # Ensure row has enough columns
-            if len(row) < 28:
-                continue
-                
-            # Team 1 players + stats
-            p1, p1g, p1a = row[6], row[7], row[8]
-            p2, p2g, p2a = row[9], row[10], row[11]
-            p3, p3g, p3a = row[12], row[13], row[14]
-
-            # Team 2 players + stats
-            o1, o1g, o1a = row[17], row[18], row[19]
-            o2, o2g, o2a = row[20], row[21], row[22]
-            o3, o3g, o3a = row[23], row[24], row[25]
-
-            # Scores
-            score1, score2 = row[26], row[27]
-
-            msg_lines.append(
-                f"🎮 Game {offset}:\n"
-                f"  {sheet_team1} — {p1} (G:{p1g}, A:{p1a}), {p2} (G:{p2g}, A:{p2a}), {p3} (G:{p3g}, A:{p3a})\n"
-                f"  {sheet_team2} — {o1} (G:{o1g}, A:{o1a}), {o2} (G:{o2g}, A:{o2a}), {o3} (G:{o3g}, A:{o3a})\n"
-                f"  🏆 Score: {sheet_team1} {score1} — {sheet_team2} {score2}\n"
-            )
-
-        await ctx.send("\n".join(msg_lines))
+    try:
+        await respond(ctx, "assists", (page, limit), ("PLAYERS",),
+                      lambda snap: render.assists(snap, page, limit))
+    except Exception as e:
+        await ctx.send(f"⚠️ Error fetching assists: {e}")
 
+@bot.hybrid_command(name="stats")
+@app_commands.describe(name="Player or team name")
+@app_commands.autocomplete(name=complete_stats)
+async def stats(ctx, *, name: str):
+    """Shows per-game stats for a player or team, worked out from every played game on the MATCHES sheet."""
+    try:
+        key = name_key(name)
+        await respond(ctx, "stats", (key,), ("MATCHES",),
+                      lambda snap: render.stats(snap, key))
     except Exception as e:
-        await ctx.send(f"⚠️ Error fetching match info: {e}")
+        await ctx.send(f"⚠️ Error fetching stats: {e}")
 
-@bot.command(name="assists")
-async def assists(ctx):
-    """Shows the top 10 assist leaders from the PLAYERS sheet, with GP and goals as tiebreakers."""
+@bot.hybrid_command(name="h2h")
+@app_commands.describe(team1="First team", team2="Second team")
+@app_commands.autocomplete(team1=complete_team, team2=complete_team)
+async def h2h(ctx, team1: str, team2: str):
+    """Shows the head-to-head record between two teams from the MATCHES sheet."""
     try:
-        all_rows = public_sheet.get_worksheet("PLAYERS")
-
-        # Headers are on row 4 (index 3), data starts at row 5 (index 4)
-        headers = [h.strip().lower() for h in all_rows[3]]
-        data = all_rows[4:]
-
-        # Column indexes
-        player_idx = 2  # Column C
-        team_idx = 4    # Column E
-        gp_idx = 5      # Column F
-        g_idx = 9       # Column J
-        a_idx = 10      # Column K
-
-        # Parse players
-        parsed = []
-        for row in data:
-            if len(row) > player_idx and row[player_idx].strip():  # Only process rows with player names
-                try:
-                    assists = int(row[a_idx]) if len(row) > a_idx and row[a_idx].strip().isdigit() else 0
-                except Exception:
-                    assists = 0
-                try:
-                    gp = int(row[gp_idx]) if len(row) > gp_idx and row[gp_idx].strip().isdigit() else 0
-                except Exception:
-                    gp = 0
-                try:
-                    goals = int(row[g_idx]) if len(row) > g_idx and row[g_idx].strip().isdigit() else 0
-                except Exception:
-                    goals = 0
-
-                parsed.append({
-                    "player": row[player_idx] if len(row) > player_idx else "Unknown",
-                    "team": row[team_idx] if len(row) > team_idx else "Unknown",
-                    "gp": gp,
-                    "goals": goals,
-                    "assists": assists
-                })
-
-        # Sort by assists DESC, GP ASC, goals DESC
-        sorted_players = sorted(parsed, key=lambda x: (-x["assists"], x["gp"], -x["goals"]))
-
-        # Build leaderboard text
-        msg = "**🅰️ TOP 10 ASSIST LEADERS 🅰️**\n"
-        medals = ["🥇", "🥈", "🥉"]
-        for i, p in enumerate(sorted_players[:10], start=1):
-            rank = medals[i-1] if i <= 3 else f"{i}."
-            msg += f"{rank} {p['player']} ({p['team']}) - {p['assists']} A, {p['goals']} G, {p['gp']} GP\n"
+        pair = (name_key(team1), name_key(team2))
+        await respond(ctx, "h2h", pair, ("MATCHES",),
+                      lambda snap: render.h2h(snap, *pair))
+    except Exception as e:
+        await ctx.send(f"⚠️ Error fetching head-to-head: {e}")
+
+# -------------------- Live Messages --------------------
+@bot.command(name="live")
+async def live(ctx, board: str = "", *args):
+    """Posts a pinned standings/topscorers/assists message that updates itself. Usage: $live <board> [page] [--limit N]"""
+    if ctx.guild is None or not ctx.author.guild_permissions.manage_messages:
+        await ctx.send("❌ Live messages can only be set up in a server by someone who can manage messages.")
+        return
+    board = board.lower()
+    try:
+        if board not in LIVE_BOARDS:
+            raise ValueError(board)
+        page, limit = parse_page_args(args, default_limit=LIVE_DEFAULT_LIMITS[board])
+    except ValueError:
+        await ctx.send(f"❌ Usage: `$live <{'|'.join(LIVE_BOARDS)}> [page] [--limit N]`")
+        return
 
-        await ctx.send(msg)
+    try:
+        snap = await tournament.snapshot(LIVE_BOARDS[board][0])
+        text = live_boards.render(snap, board, page, limit)
+        message = await ctx.send(text)
+    except Exception as e:
+        await ctx.send(f"⚠️ Error setting up live {board}: {e}")
+        return
+    try:
+        await message.pin()
+    except discord.HTTPException:
+        pass  # still live, just not pinned (no permission or too many pins)
+    replaced = live_boards.subscribe(ctx.channel.id, board, message.id, page, limit, text)
+    if replaced is not None:
+        await live_boards.retire(ctx.channel.id, replaced)
+
+@bot.command(name="unlive")
+async def unlive(ctx, board: str = ""):
+    """Stops updating this channel's live message for a board. Usage: $unlive <board>"""
+    if ctx.guild is None or not ctx.author.guild_permissions.manage_messages:
+        await ctx.send("❌ Only someone who can manage messages can stop a live message.")
+        return
+    message_id = live_boards.unsubscribe(ctx.channel.id, board.lower())
+    if message_id is None:
+        await ctx.send(f"❌ There is no live {board or 'message'} in this channel.")
+    else:
+        await live_boards.retire(ctx.channel.id, message_id)
+        await ctx.send(f"✅ Live {board.lower()} stopped; the message will no longer update.")
+
+# -------------------- History --------------------
+HISTORY_USAGE = ("❌ Usage: `$history player <name> [--since 3d]`, `$history standings <when>` "
+                 "or `$history changes [--since 3d]`. Times are like `2h`, `3d` (ago) or `2025-07-12 18:00` (UTC).")
+
+def standings_builder():
+    """Turns successive STANDINGS_TAB rows replayed from the history log into StandingsTables"""
+    if standings_engine is None:
+        return lambda rows, diff: StandingsTable.from_rows(rows)
+    engine = StandingsEngine(sheet_cache, tiebreakers=standings_engine.tiebreakers)
+
+    def build(rows, diff):
+        engine.apply(diff or RowDiff.between(None, rows), rows)
+        return engine.table
+    return build
+
+def split_since(args):
+    """Takes '--since X' out of the arguments; returns (other args, unix time or None)"""
+    args = list(args)
+    if "--since" not in args:
+        return args, None
+    i = args.index("--since")
+    if i + 1 >= len(args):
+        raise ValueError("--since needs a time")
+    n = when_length(args[i + 1:])  # '2025-07-12 18:00' arrives as two arguments
+    since = parse_when(" ".join(args[i + 1:i + 1 + n]))
+    del args[i:i + 1 + n]
+    return args, since
+
+@bot.command(name="history")
+async def history(ctx, what: str = "", *args):
+    """Past stats and standings from the change log. Usage: $history player <name> | standings <when> | changes"""
+    if history_log is None:
+        await ctx.send("❌ The history log is turned off.")
+        return
+    what = what.lower()
+    try:
+        args, since = split_since(args)
+        text = " ".join(args)
+        if what == "player" and text:
+            key = (name_key(text), since)
+        elif what == "standings" and text:
+            when = parse_when(text)
+            key = (when,)
+        elif what == "changes" and not text:
+            key = (since,)
+        else:
+            raise ValueError(what)
+    except ValueError:
+        await ctx.send(HISTORY_USAGE)
+        return
+
+    loop = asyncio.get_running_loop()
+
+    async def build():
+        # Catching up on and replaying the log read the file and decode records: keep them off the event loop
+        await loop.run_in_executor(None, history_log.catch_up)
+        if what == "player":
+            snap = await tournament.snapshot("PLAYERS")
+            current = snap.players.resolve(key[0])
+            name = current.name if current else key[0]
+            series = await loop.run_in_executor(None, player_series, history_log, name, since)
+            return render.history_player(name, series)
+        if what == "standings":
+            rows = await loop.run_in_executor(None, history_log.rows_at, STANDINGS_TAB, when)
+            table = standings_builder()(rows, None) if rows is not None else None
+            return render.history_standings(Snapshot(None, table, None, version=0), when, 1, 20)
+        events = await loop.run_in_executor(
+            None, standings_changes, history_log, STANDINGS_TAB, standings_builder(), since)
+        return render.history_changes(events)
 
+    try:
+        await send_governed(ctx, f"history_{what}", key, build)
     except Exception as e:
-        await ctx.send(f"⚠️ Error fetching assists: {e}")
+        await ctx.send(f"⚠️ Error reading history: {e}")
 
 print("bot.py loaded")
@@ -0,0 +1,138 @@
+from bisect import bisect_left
+from collections import Counter
+
+# Fuzzy name lookups for $player and $team and slash-command autocomplete:
+# unique-prefix resolution, prefix completion and did-you-mean suggestions
+# from a trigram index built once per refresh.
+# Everything here works on normalized keys (see tournament.name_key).
+
+MIN_PREFIX = 2         # shorter input is never resolved as a prefix
+MAX_SCAN = 4000        # posting entries counted per query, rarest trigrams first
+RERANK = 12            # candidates re-ranked by edit distance
+MIN_SIMILARITY = 0.5   # 1 - distance / longer length
+
+
+def trigrams(key):
+    """Trigrams of a key padded like pg_trgm, so short names still get some"""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def levenshtein(a, b):
+    """Edit distance via Myers' bit-parallel algorithm: one pass of integer ops per char of ``b``"""
+    if not a or not b:
+        return len(a) or len(b)
+    peq = {}
+    for i, ch in enumerate(a):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    mask = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    pv, mv, score = mask, 0, len(a)
+    for ch in b:
+        eq = peq.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+    return score
+
+
+class FuzzyIndex:
+    """Trigram postings plus a sorted key list over a set of names.
+
+    Built from (key, display name) pairs; the first pair wins when a key
+    repeats. Lookups never scan every name: prefixes are a binary search and
+    suggestions only count the postings of the query's rarest trigrams before
+    re-ranking a handful of candidates by edit distance.
+    """
+    __slots__ = ("keys", "names", "_ids", "_sorted", "_postings")
+
+    def __init__(self, pairs):
+        self.keys = []
+        self.names = []
+        self._ids = {}
+        postings = {}
+        for key, name in pairs:
+            if not key or key in self._ids:
+                continue
+            i = self._ids[key] = len(self.keys)
+            self.keys.append(key)
+            self.names.append(name)
+            for gram in trigrams(key):
+                postings.setdefault(gram, []).append(i)
+        self._postings = postings
+        self._sorted = sorted(self._ids)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def with_prefix(self, prefix, limit):
+        """Up to ``limit`` keys starting with ``prefix``, in sorted order"""
+        keys = self._sorted
+        i = bisect_left(keys, prefix)
+        found = []
+        while i < len(keys) and len(found) < limit and keys[i].startswith(prefix):
+            found.append(keys[i])
+            i += 1
+        return found
+
+    def resolve(self, key):
+        """The only key starting with ``key``, or None when there are none or several"""
+        if len(key) < MIN_PREFIX:
+            return None
+        found = self.with_prefix(key, 2)
+        return found[0] if len(found) == 1 else None
+
+    def suggest(self, key, limit=3):
+        """Display names of the closest keys: prefix matches first, then near misses"""
+        found = self.with_prefix(key, limit) if len(key) >= MIN_PREFIX else []
+        if len(found) < limit:
+            taken = set(found)
+            found.extend(k for k in self._near(key) if k not in taken)
+        return [self.names[self._ids[k]] for k in found[:limit]]
+
+    def complete(self, key, limit=25):
+        """Display names for autocomplete: keys starting with ``key`` in sorted order, then near misses"""
+        found = self.with_prefix(key, limit)
+        if len(found) < limit and key:
+            taken = set(found)
+            found.extend(k for k in self._near(key) if k not in taken)
+        return [self.names[self._ids[k]] for k in found[:limit]]
+
+    def _near(self, key):
+        # Count shared trigrams over the rarest postings only: common trigrams
+        # ("the", " pl") say little and would make every query scan every name
+        lists = sorted((self._postings[g] for g in trigrams(key) if g in self._postings), key=len)
+        counts = Counter()
+        scanned = 0
+        for ids in lists:
+            if scanned and scanned + len(ids) > MAX_SCAN:
+                break
+            counts.update(ids)
+            scanned += len(ids)
+
+        if not counts:
+            return []
+        # Only names sharing close to the most trigrams are worth an edit distance
+        floor = max(counts.values()) - 2
+        close = [i for i, n in counts.items() if n >= floor]
+        if len(close) > RERANK:
+            close.sort(key=counts.__getitem__, reverse=True)
+            del close[RERANK:]
+
+        scored = []
+        for i in close:
+            candidate = self.keys[i]
+            similarity = 1 - levenshtein(key, candidate) / max(len(key), len(candidate))
+            if similarity >= MIN_SIMILARITY:
+                scored.append((-similarity, candidate))
+        scored.sort()
+        return [candidate for _, candidate in scored]
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+
+from metrics import COMMAND_QUEUE_DEPTH, COMMANDS_COALESCED, COMMANDS_RUNNING, COMMANDS_SHED
+
+logger = logging.getLogger(__name__)
+
+
+class Busy(Exception):
+    """The governor turned a command away; reply with a short "try again" instead"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Governor:
+    """Admission control for command executions.
+
+    Identical commands (same name and normalized args) that arrive while one
+    is already running share that execution and its result instead of starting
+    their own. New executions need a slot under both the global cap
+    (``max_concurrent``) and their guild's cap (``per_guild``); callers wait
+    for one for at most ``queue_timeout`` seconds, and no more than
+    ``max_queue`` may wait at once. Anything beyond that is shed with Busy.
+    """
+
+    def __init__(self, max_concurrent=16, per_guild=4, max_queue=64, queue_timeout=3.0):
+        self.max_concurrent = max_concurrent
+        self.per_guild = per_guild
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.running = 0
+        self._global = asyncio.Semaphore(max_concurrent)
+        self._guilds = {}
+        self._inflight = {}
+
+    async def run(self, command, args, guild_id, factory):
+        """Returns ``await factory()``, shared with identical commands in flight. Raises Busy when shed."""
+        key = (command, args)
+        task = self._inflight.get(key)
+        if task is not None:
+            COMMANDS_COALESCED.inc(command=command)
+            return await asyncio.shield(task)
+
+        if self.waiting >= self.max_queue:
+            self._shed(command, "queue_full")
+        # Counted as waiting right away, before the task gets to run
+        self.waiting += 1
+        COMMAND_QUEUE_DEPTH.set(self.waiting)
+
+        task = asyncio.ensure_future(self._execute(command, guild_id, factory))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finish(key, t))
+        # Shielded so a caller that goes away does not cancel it for the others
+        return await asyncio.shield(task)
+
+    def _guild_semaphore(self, guild_id):
+        semaphore = self._guilds.get(guild_id)
+        if semaphore is None:
+            semaphore = self._guilds[guild_id] = asyncio.Semaphore(self.per_guild)
+        return semaphore
+
+    async def _execute(self, command, guild_id, factory):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        acquired = []
+        try:
+            for semaphore in (self._guild_semaphore(guild_id), self._global):
+                if semaphore.locked():
+                    await asyncio.wait_for(semaphore.acquire(), max(deadline - loop.time(), 0.001))
+                else:
+                    await semaphore.acquire()
+                acquired.append(semaphore)
+        except asyncio.TimeoutError:
+            for semaphore in acquired:
+                semaphore.release()
+            self._shed(command, "timeout")
+        except BaseException:
+            for semaphore in acquired:
+                semaphore.release()
+            raise
+        finally:
+            self.waiting -= 1
+            COMMAND_QUEUE_DEPTH.set(self.waiting)
+
+        self.running += 1
+        COMMANDS_RUNNING.set(self.running)
+        try:
+            return await factory()
+        finally:
+            self.running -= 1
+            COMMANDS_RUNNING.set(self.running)
+            for semaphore in acquired:
+                semaphore.release()
+
+    def _shed(self, command, reason):
+        COMMANDS_SHED.inc(command=command, reason=reason)
+        logger.warning(f"Shedding {command}: {reason} ({self.waiting} waiting, {self.running} running)")
+        raise Busy(reason)
+
+    def _finish(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here so an unawaited failure is not logged as lost
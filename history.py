@@ -0,0 +1,438 @@
+import fcntl
+import logging
+import marshal
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from sheets import RowDiff
+from tournament import name_key, player_from_row
+
+logger = logging.getLogger(__name__)
+
+# Append-only log of every change to the cached tabs, so past states can be
+# rebuilt without re-downloading old sheet revisions. Each refresh that changes
+# a tab appends one record holding its RowDiff. The first record a process
+# writes for a tab, and every ``checkpoint_every``-th after that, holds the
+# tab's full rows instead, so rebuilding any moment decodes one checkpoint and
+# a bounded number of diffs.
+#
+# File layout: MAGIC, FORMAT_VERSION (unsigned short), then records of
+# _RECORD (body length, crc32 of the body, unix time, kind, changed row count,
+# tab name length), the tab name and the body: a zlib-compressed marshal dump of
+# the rows (CHECKPOINT) or of (changed rows by index, new row count) (DIFF).
+# Only the fixed-size headers are read to build the in-memory index by time.
+MAGIC = b"BBWCHIST"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct(f"<{len(MAGIC)}sH")
+_RECORD = struct.Struct("<IIdBIB")
+CHECKPOINT, DIFF = 0, 1
+
+
+class HistoryFormatError(Exception):
+    pass
+
+
+class _TabIndex:
+    """Parallel lists, one entry per record of a tab in file order"""
+    __slots__ = ("times", "offsets", "kinds", "changed", "checkpoints")
+
+    def __init__(self):
+        self.times = []
+        self.offsets = []
+        self.kinds = []
+        self.changed = []
+        self.checkpoints = []  # position of the checkpoint each record builds on
+
+
+def _apply(rows, changed, length):
+    """RowDiff.apply, in place"""
+    del rows[length:]
+    rows.extend([] for _ in range(length - len(rows)))
+    for i, row in changed.items():
+        rows[i] = row
+
+
+class HistoryLog:
+    """Cache listener that appends every tab change to ``path``, and answers queries about the past.
+
+    Records are encoded and appended by one worker thread, in order, so a
+    large checkpoint never holds up the event loop. One process at a time
+    writes the file (an exclusive flock); any other process opening it only
+    reads, catching up on records appended since its last look before each
+    query, and tries the lock again on every change it sees, so one of them
+    takes over writing when the writer exits.
+    """
+
+    def __init__(self, cache, path, checkpoint_every=50):
+        self.cache = cache
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.writable = False
+        self._fd = None
+        self._end = 0        # file offset the index has been built up to
+        self._tabs = {}      # sheet name -> _TabIndex
+        self._since_checkpoint = {}  # sheet name -> diffs queued since this process's last checkpoint
+        self._gaps = set()   # tabs whose last write failed: diffs wait for a checkpoint (writer thread)
+        self._writer = None
+        self._settled = None  # the worker's catch-up after taking the lock
+        self._scanning = threading.Lock()  # held while the index grows: a reader's catch-up may meet a take-over
+
+    # -------------------- File --------------------
+    def open(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        size = os.fstat(fd).st_size
+        if size:
+            magic, version = _HEADER.unpack(os.pread(fd, _HEADER.size, 0).ljust(_HEADER.size, b"\0"))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                os.close(fd)
+                raise HistoryFormatError(f"{self.path} is not a history log of format version {FORMAT_VERSION}")
+        self._fd = fd
+        self._end = _HEADER.size
+        if self._take_over():
+            self._settled.result()
+        else:
+            logger.info(f"History log {self.path} is written by another process; reading only")
+            with self._scanning:
+                self._scan()
+        records = sum(len(tab.times) for tab in self._tabs.values())
+        logger.info(f"History log {self.path}: {records} records, {self._end} bytes")
+        return self
+
+    def _take_over(self):
+        """Becomes the writer if no other process holds the flock; returns whether it did.
+
+        Only the lock is taken here; catching up on the file is the worker's
+        first job, ahead of any record queued after it.
+        """
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-log")
+        self.writable = True
+        self._settled = self._writer.submit(self._settle)
+        return True
+
+    def _settle(self):
+        try:
+            with self._scanning:
+                if os.fstat(self._fd).st_size == 0:
+                    os.write(self._fd, _HEADER.pack(MAGIC, FORMAT_VERSION))
+                self._scan()
+
+                size = os.fstat(self._fd).st_size
+                if self._end < size:
+                    # A write cut short by a crash: drop it so new records follow the last whole one
+                    logger.warning(f"Dropping {size - self._end} bytes of an incomplete record at the end of {self.path}")
+                    os.ftruncate(self._fd, self._end)
+        except OSError as e:
+            # Records queued behind this are dropped; the next change tries the lock again
+            logger.warning(f"Could not take over writing the history log {self.path}: {e}")
+            self.writable = False
+            self._since_checkpoint.clear()  # so whoever writes next starts each tab in full
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            raise
+
+    def flush(self):
+        """Waits until every queued record is on disk and indexed"""
+        if self._writer is not None:
+            self._writer.submit(lambda: None).result()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+            self._writer = None
+        if self._fd is not None:
+            os.close(self._fd)  # also releases the flock
+            self._fd = None
+            self.writable = False
+
+    def catch_up(self):
+        """Index records another process appended since the last call"""
+        with self._scanning:
+            if self._fd is not None and not self.writable:
+                self._scan()
+
+    def _scan(self):
+        size = os.fstat(self._fd).st_size
+        offset = self._end
+        while offset + _RECORD.size <= size:
+            length, _, timestamp, kind, changed, name_length = _RECORD.unpack(
+                os.pread(self._fd, _RECORD.size, offset))
+            end = offset + _RECORD.size + name_length + length
+            if end > size:
+                break  # still being written, or torn
+            name = os.pread(self._fd, name_length, offset + _RECORD.size).decode()
+            self._index(name, timestamp, kind, changed, offset)
+            offset = end
+        self._end = offset
+
+    def _index(self, sheet_name, timestamp, kind, changed, offset):
+        tab = self._tabs.get(sheet_name)
+        new = tab is None
+        if new:
+            if kind != CHECKPOINT:
+                return  # nothing to apply this diff to
+            tab = _TabIndex()
+        tab.offsets.append(offset)
+        tab.kinds.append(kind)
+        tab.changed.append(changed)
+        tab.checkpoints.append(len(tab.offsets) - 1 if kind == CHECKPOINT else tab.checkpoints[-1])
+        # Queries go by ``times``, so it grows last and a reader never sees half a record
+        tab.times.append(timestamp)
+        if new:
+            self._tabs[sheet_name] = tab
+
+    def _read(self, offset):
+        header = os.pread(self._fd, _RECORD.size, offset)
+        length, crc, _, _, _, name_length = _RECORD.unpack(header)
+        body = os.pread(self._fd, length, offset + _RECORD.size + name_length)
+        if len(body) != length or zlib.crc32(body) != crc:
+            raise HistoryFormatError(f"corrupt record at offset {offset} of {self.path}")
+        return marshal.loads(zlib.decompress(body))
+
+    # -------------------- Recording --------------------
+    def __call__(self, sheet_name, diff):
+        if not self.writable:
+            # Whoever wrote the file may have exited since: try its lock again
+            if self._fd is None or not self._take_over():
+                return
+            logger.info(f"Took over writing the history log {self.path}")
+        # Cached rows and diffs are never modified once built, so the worker can encode them later
+        count = self._since_checkpoint.get(sheet_name)
+        if count is None or count >= self.checkpoint_every:
+            rows = self.cache.rows(sheet_name)
+            record = (CHECKPOINT, rows, len(rows))
+            self._since_checkpoint[sheet_name] = 0
+        else:
+            record = (DIFF, (diff.changed, diff.length), len(diff.changed))
+            self._since_checkpoint[sheet_name] = count + 1
+        self._writer.submit(self._append, sheet_name, *record, time.time())
+
+    def _append(self, sheet_name, kind, data, changed, timestamp):
+        if not self.writable:
+            return  # taking over the file failed
+        if kind == DIFF and sheet_name in self._gaps:
+            return  # would not apply to what the log holds
+        try:
+            self._write(sheet_name, kind, data, changed, timestamp)
+        except OSError as e:
+            logger.warning(f"Could not append {sheet_name} to the history log: {e}")
+            self._gaps.add(sheet_name)
+            self._since_checkpoint.pop(sheet_name, None)  # the next change is written in full
+        else:
+            self._gaps.discard(sheet_name)
+
+    def _write(self, sheet_name, kind, data, changed, timestamp):
+        body = zlib.compress(marshal.dumps(data), 6)
+        name = sheet_name.encode()
+        tab = self._tabs.get(sheet_name)
+        if tab is not None:
+            timestamp = max(timestamp, tab.times[-1])  # the index needs sorted times
+        record = _RECORD.pack(len(body), zlib.crc32(body), timestamp, kind, changed, len(name)) + name + body
+        with self._scanning:
+            offset = self._end
+            try:
+                os.write(self._fd, record)
+            except OSError:
+                os.ftruncate(self._fd, offset)  # keep the file in step with the index
+                raise
+            self._end += len(record)
+            self._index(sheet_name, timestamp, kind, changed, offset)
+
+    # -------------------- Queries --------------------
+    @property
+    def tabs(self):
+        return list(self._tabs)
+
+    def first_time(self, sheet_name):
+        tab = self._tabs.get(sheet_name)
+        return tab.times[0] if tab else None
+
+    def recent(self, sheet_name, records):
+        """Start time of a window holding the tab's last ``records`` records that changed rows.
+
+        None when the whole log is shorter than that. Found from the index
+        alone, so no record is read.
+        """
+        tab = self._tabs.get(sheet_name)
+        if tab is None:
+            return None
+        seen = 0
+        for i in range(len(tab.changed) - 1, -1, -1):
+            if tab.changed[i]:
+                seen += 1
+                if seen >= records:
+                    return tab.times[i]
+        return None
+
+    def changes(self, sheet_name, since=None, until=None):
+        """(time, rows changed) of every record in the window, straight from the index"""
+        tab = self._tabs.get(sheet_name)
+        if tab is None:
+            return []
+        start, stop = self._window(tab, since, until)
+        return list(zip(tab.times[start:stop], tab.changed[start:stop]))
+
+    def rows_at(self, sheet_name, when):
+        """The tab's rows as they were at unix time ``when``, or None before the first record"""
+        tab = self._tabs.get(sheet_name)
+        if tab is None:
+            return None
+        i = bisect_right(tab.times, when) - 1
+        if i < 0:
+            return None
+        rows = None
+        for _, rows, _ in self._replay(tab, tab.checkpoints[i], i + 1):
+            pass
+        return rows
+
+    def states(self, sheet_name, since=None, until=None):
+        """Yields (time, rows, diff) for each record in the window, oldest first.
+
+        ``rows`` is one list updated in place, so use it before the next step;
+        ``diff`` is the RowDiff from the previous state, or None for the first.
+        """
+        tab = self._tabs.get(sheet_name)
+        if tab is None:
+            return
+        start, stop = self._window(tab, since, until)
+        if start >= stop:
+            return
+        # Replay silently from the checkpoint up to the window, then report each step
+        first = tab.checkpoints[start]
+        reported = False
+        for i, (timestamp, rows, diff) in enumerate(self._replay(tab, first, stop), start=first):
+            if i >= start:
+                yield timestamp, rows, diff if reported else None
+                reported = True
+
+    def _window(self, tab, since, until):
+        start = bisect_right(tab.times, since) - 1 if since is not None else 0
+        stop = bisect_right(tab.times, until) if until is not None else len(tab.times)
+        return max(start, 0), stop
+
+    def _replay(self, tab, start, stop):
+        rows = []
+        for i in range(start, stop):
+            data = self._read(tab.offsets[i])
+            if tab.kinds[i] == CHECKPOINT:
+                old_length = len(rows)
+                rows[:] = data
+                diff = RowDiff(dict(enumerate(rows)), len(rows), old_length)
+            else:
+                changed, length = data
+                diff = RowDiff(changed, length, len(rows))
+                _apply(rows, changed, length)
+            yield tab.times[i], rows, diff
+
+
+# -------------------- Time Series --------------------
+# Without a start time the queries below only replay the last RECENT_RECORDS
+# changes of the tab (plus the diffs since the checkpoint before them), so
+# their cost does not grow with the log
+RECENT_RECORDS = 500
+
+
+def player_series(log, name, since=None, limit=15, records=RECENT_RECORDS):
+    """The last ``limit`` distinct (time, Player) values of a player on the PLAYERS tab.
+
+    Follows the player's row through each diff and only reads rows the diff
+    touched, so the cost is one pass over the diffs rather than the tab.
+    """
+    if since is None:
+        since = log.recent("PLAYERS", records)
+    key = name_key(name)
+    series = []
+    row_index = None
+    for timestamp, rows, diff in log.states("PLAYERS", since):
+        if diff is not None and row_index is not None and row_index < diff.length and row_index not in diff.changed:
+            continue  # the player's row was left alone
+        row_index = _find_player(rows, key, diff, row_index)
+        if row_index is None:
+            continue
+        player = player_from_row(rows[row_index])
+        if not series or series[-1][1] != player:
+            series.append((timestamp, player))
+    return series[-limit:]
+
+
+def _find_player(rows, key, diff, row_index):
+    if diff is None:
+        candidates = range(len(rows))
+    elif row_index is not None and row_index < len(rows) and _is_player(rows[row_index], key):
+        return row_index
+    else:
+        candidates = diff.changed  # an unchanged row cannot have become the player
+    found = next((i for i in candidates if _is_player(rows[i], key)), None)
+    if found is None and row_index is not None:
+        found = next((i for i in range(len(rows)) if _is_player(rows[i], key)), None)
+    return found
+
+
+def _is_player(row, key):
+    player = player_from_row(row) if row else None
+    return player is not None and name_key(player.name) == key
+
+
+def standings_changes(log, sheet_name, build, since=None, limit=15, records=RECENT_RECORDS):
+    """When the standings moved: (time, [(team, old rank, new rank, old pts, new pts), ...]).
+
+    ``build(rows, diff)`` turns the tab's rows (and the RowDiff that led to
+    them) into a StandingsTable; records that leave every rank and points
+    total as they were are skipped.
+    """
+    if since is None:
+        since = log.recent(sheet_name, records)
+    events = []
+    previous = None
+    for timestamp, rows, diff in log.states(sheet_name, since):
+        table = build(rows, diff)
+        current = {name_key(t.team): (rank, t.pts, t.team) for rank, t in enumerate(table.ranked, start=1)}
+        if previous is not None:
+            moves = [
+                (team, previous[key][0] if key in previous else None, rank,
+                 previous[key][1] if key in previous else None, pts)
+                for key, (rank, pts, team) in current.items()
+                if previous.get(key, (None, None))[:2] != (rank, pts)
+            ]
+            if moves:
+                events.append((timestamp, moves))
+        previous = current
+    return events[-limit:]
+
+
+_RELATIVE = re.compile(r"^(\d+(?:\.\d+)?)\s*([mhdw])$")
+_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_CLOCK = re.compile(r"^\d{1,2}:\d{2}(?::\d{2})?$")
+
+
+def when_length(tokens):
+    """How many of the leading ``tokens`` spell one time: 2 for '2025-07-12', '18:00', else 1"""
+    if len(tokens) >= 2 and _DATE.match(tokens[0]) and _CLOCK.match(tokens[1]):
+        return 2
+    return 1
+
+
+def parse_when(text, now=None):
+    """Unix time from '2h' / '3d' (ago), '2025-07-12', '2025-07-12 18:30' (UTC) or a unix timestamp"""
+    text = text.strip().lower()
+    now = time.time() if now is None else now
+    relative = _RELATIVE.match(text)
+    if relative:
+        return now - float(relative.group(1)) * _UNITS[relative.group(2)]
+    if text.isdigit() and len(text) >= 9:
+        return float(text)
+    parsed = datetime.fromisoformat(text.upper().replace(" ", "T"))  # raises ValueError
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+import discord
+
+from metrics import LIVE_EDITS, LIVE_SUBSCRIPTIONS
+
+logger = logging.getLogger(__name__)
+
+LIVE_FOOTER = "\n_🔴 Live: updates by itself when the sheet changes_"
+ENDED_FOOTER = "\n_⚪ No longer live: stopped updating {when}_"
+
+
+class LiveBoards:
+    """Messages that keep themselves up to date.
+
+    Each subscription is one message in one channel showing one board (e.g.
+    standings page 1). The object is a SheetCache listener: a change to a tab
+    marks the boards built from it dirty, and ``delay`` seconds after the first
+    change every dirty subscription across all channels is re-rendered in one
+    batch. Only messages whose text actually changed are edited, at most one
+    edit every ``edit_gap`` seconds. Subscriptions are saved to ``path``.
+
+    ``boards`` maps a board name to (sheet name, renderer(snap, page, limit)).
+    """
+
+    def __init__(self, bot, tournament, boards, path, delay=10, edit_gap=0.5):
+        self.bot = bot
+        self.tournament = tournament
+        self.boards = boards
+        self.path = path
+        self.delay = delay
+        self.edit_gap = edit_gap
+        self.subscriptions = {}  # (channel_id, board) -> {"message_id", "page", "limit"}
+        self._shown = {}         # (channel_id, board) -> text currently in the message
+        self._dirty = set()
+        self._pending = None
+
+    # -------------------- Subscriptions --------------------
+    def load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read live subscriptions from {self.path}: {e}")
+            return
+        for sub in saved:
+            self.subscriptions[(sub["channel_id"], sub["board"])] = {
+                "message_id": sub["message_id"], "page": sub["page"], "limit": sub["limit"]}
+        LIVE_SUBSCRIPTIONS.set(len(self.subscriptions))
+        logger.info(f"Loaded {len(self.subscriptions)} live subscriptions from {self.path}")
+
+    def save(self):
+        saved = [{"channel_id": channel_id, "board": board, **sub}
+                 for (channel_id, board), sub in self.subscriptions.items()]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(saved, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save live subscriptions to {self.path}: {e}")
+
+    def subscribe(self, channel_id, board, message_id, page, limit, text):
+        """Returns the message id of the subscription this one replaces, or None"""
+        key = (channel_id, board)
+        old = self.subscriptions.get(key)
+        self.subscriptions[key] = {"message_id": message_id, "page": page, "limit": limit}
+        self._shown[key] = text
+        LIVE_SUBSCRIPTIONS.set(len(self.subscriptions))
+        self.save()
+        if old is not None and old["message_id"] != message_id:
+            return old["message_id"]
+        return None
+
+    def unsubscribe(self, channel_id, board):
+        """Returns the message id of the removed subscription, or None"""
+        sub = self.subscriptions.pop((channel_id, board), None)
+        self._shown.pop((channel_id, board), None)
+        LIVE_SUBSCRIPTIONS.set(len(self.subscriptions))
+        if sub is not None:
+            self.save()
+            return sub["message_id"]
+        return None
+
+    async def retire(self, channel_id, message_id):
+        """Marks a message that no longer updates as such and unpins it.
+
+        Called for replaced and stopped subscriptions, so an old message never
+        keeps claiming to be live. Best effort: it may be deleted already.
+        """
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return
+        try:
+            message = await channel.fetch_message(message_id)
+        except discord.HTTPException:
+            # Cannot read it (or it is gone): an unpin needs no content
+            message = channel.get_partial_message(message_id)
+        else:
+            content = message.content.replace(LIVE_FOOTER, "")
+            try:
+                await message.edit(content=content + ENDED_FOOTER.format(when=f"<t:{int(time.time())}:f>"))
+            except discord.HTTPException as e:
+                logger.info(f"Could not mark old live message {message_id} in channel {channel_id} as ended: {e}")
+        try:
+            await message.unpin()
+        except discord.HTTPException:
+            pass  # not pinned, no permission, or deleted
+
+    def render(self, snap, board, page, limit):
+        _, renderer = self.boards[board]
+        return renderer(snap, page, limit) + LIVE_FOOTER
+
+    # -------------------- Updates --------------------
+    def start(self):
+        """Catch every message up once, e.g. with changes made while the bot was down"""
+        self._dirty.update(self.boards)
+        self._schedule()
+
+    def __call__(self, sheet_name, diff):
+        boards = {board for board, (tab, _) in self.boards.items() if tab == sheet_name}
+        if boards:
+            self._dirty.update(boards)
+            self._schedule()
+
+    def _schedule(self):
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await self.bot.wait_until_ready()
+        # Changes landing while a batch is being sent are picked up by the next round
+        while self._dirty:
+            await asyncio.sleep(self.delay)
+            dirty, self._dirty = self._dirty, set()
+            try:
+                snap = await self.tournament.snapshot(*{self.boards[board][0] for board in dirty})
+            except Exception as e:
+                logger.warning(f"Could not load data for live boards: {e!r}")
+                return  # the next successful refresh triggers another flush
+            for (channel_id, board), sub in list(self.subscriptions.items()):
+                if board not in dirty:
+                    continue
+                text = self.render(snap, board, sub["page"], sub["limit"])
+                if self._shown.get((channel_id, board)) == text:
+                    LIVE_EDITS.inc(board=board, outcome="unchanged")
+                    continue
+                if await self._edit(channel_id, board, sub["message_id"], text):
+                    await asyncio.sleep(self.edit_gap)
+
+    async def _edit(self, channel_id, board, message_id, text):
+        """Edits one live message; returns whether a request was made"""
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return False  # not in this process's shards (or not cached yet)
+        try:
+            await channel.get_partial_message(message_id).edit(content=text)
+        except discord.NotFound:
+            logger.info(f"Live {board} message in channel {channel_id} is gone; unsubscribing")
+            LIVE_EDITS.inc(board=board, outcome="gone")
+            self.unsubscribe(channel_id, board)
+        except discord.Forbidden:
+            # The message is still there but can no longer be kept up to date
+            logger.info(f"Live {board} message in channel {channel_id} can no longer be edited; unsubscribing")
+            LIVE_EDITS.inc(board=board, outcome="gone")
+            self.unsubscribe(channel_id, board)
+            await self.retire(channel_id, message_id)
+        except discord.HTTPException as e:
+            logger.warning(f"Could not update live {board} message in channel {channel_id}: {e}")
+            LIVE_EDITS.inc(board=board, outcome="error")
+        else:
+            self._shown[(channel_id, board)] = text
+            LIVE_EDITS.inc(board=board, outcome="edited")
+        return True
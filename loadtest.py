@@ -0,0 +1,344 @@
+"""End-to-end load test of the bot's command handlers against a local stand-in sheet.
+
+Starts the stand-in gviz server (standin.py) in this process, points the
+bot's PublicSheet at it and calls the real command callbacks from bot.py with
+fake contexts, so everything from the governor down to the HTTP fetches runs
+as it would on match night. Nothing connects to Discord or Google.
+
+Load comes either as an open loop (--rate commands per second with random
+arrivals, at most --concurrency in flight) or, without --rate, as a closed
+loop of --concurrency users sending their next command as soon as the last
+one is answered. The stand-in can add latency, 500s and 429s, and --churn
+edits the sheet while the test runs so refreshes find real changes.
+
+    python loadtest.py --duration 30 --rate 200
+    python loadtest.py --concurrency 50 --latency 0.3 --jitter 0.3 --rate-limit-rate 0.05 --churn 5
+    python loadtest.py --teams 200 --players 8 --ttl 10 --output load.json
+
+Prints commands/sec, latency percentiles per command, event-loop lag and how
+many requests reached the stand-in sheet, and optionally writes them as JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from aiohttp import web
+
+import metrics
+from standin import add_fault_args, create_app
+from synthetic import make_sheets
+
+# Relative weights of the commands sent; override with e.g. --mix player=5,standings=1
+MIX = {
+    "player": 25, "team": 10, "standings": 15, "topscorers": 10, "assists": 5,
+    "matchlink": 5, "matchinfo": 10, "stats": 10, "h2h": 10,
+}
+TABS = ("PLAYERS", "GROUP_STAGE", "MATCHES")
+
+
+class FakeContext:
+    """Just enough of commands.Context for the command callbacks"""
+
+    def __init__(self, user_id, guild_id, send_latency=0.0):
+        self.author = SimpleNamespace(id=user_id)
+        self.guild = SimpleNamespace(id=guild_id)
+        self.channel = SimpleNamespace(id=guild_id)
+        self.interaction = None
+        self.send_latency = send_latency
+        self.replies = []
+
+    async def send(self, content=None, **kwargs):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)  # the Discord API round trip
+        self.replies.append(content)
+
+    async def defer(self):
+        pass
+
+
+class Workload:
+    """Random commands with arguments drawn from the names on the synthetic sheets"""
+
+    def __init__(self, sheets, mix, seed=None):
+        self.random = random.Random(seed)
+        self.commands = list(mix)
+        self.weights = [mix[c] for c in self.commands]
+        self.players = [row[2] for row in sheets["PLAYERS"][4:] if row[2]]
+        self.teams = sorted({row[4] for row in sheets["PLAYERS"][4:] if row[4]})
+        self.matchups = sorted({(row[5], row[16]) for row in sheets["MATCHES"][1:] if row[5] and row[16]})
+
+    def next(self):
+        """(command, positional args, keyword args) as Discord would pass them"""
+        rnd = self.random
+        command = rnd.choices(self.commands, self.weights)[0]
+        if command == "player":
+            return command, (), {"name": rnd.choice(self.players)}
+        if command == "team":
+            return command, (), {"team_name": rnd.choice(self.teams)}
+        if command == "stats":
+            return command, (), {"name": rnd.choice(self.players + self.teams)}
+        if command in ("matchlink", "matchinfo", "h2h"):
+            return command, rnd.choice(self.matchups), {}
+        return command, (str(rnd.randint(1, 3)),), {}  # leaderboards: a random page
+
+
+class LagSampler:
+    """Records how late every ``interval`` sleep wakes up"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name="loadtest-lag")
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(loop.time() - started - self.interval, 0.0))
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * p / 100), len(sorted_values) - 1)]
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+
+def churn(sheets, rnd):
+    """Edits a few cells the way scorekeepers do during a match"""
+    players = sheets["PLAYERS"]
+    row = players[rnd.randrange(4, len(players))]
+    row[9] = str(int(row[9] or 0) + 1)
+    matches = sheets["MATCHES"]
+    row = matches[rnd.randrange(1, len(matches))]
+    row[rnd.choice((26, 27))] = str(rnd.randint(0, 6))
+
+
+# -------------------- Run --------------------
+async def run(args):
+    sheets = make_sheets(args.teams, args.players, args.matchups)
+    app = create_app(sheets, args.reject_queries, latency=args.latency, jitter=args.jitter,
+                     error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                     range_shift=args.range_shift, seed=args.seed)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    standin = app["standin"]
+
+    # bot.py reads its configuration at import time, so it is imported once the
+    # stand-in's port is known; state files go to a scratch directory
+    scratch = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ.update(
+        SHEET_ID="loadtest", SHEET_URL=f"http://{host}:{port}/gviz/tq",
+        SNAPSHOT_PATH=os.path.join(scratch, "snapshot.bin"), LIVE_PATH=os.path.join(scratch, "live.json"),
+        HISTORY_PATH=os.path.join(scratch, "history.log"),
+    )
+    os.environ.pop("SHARED_SNAPSHOT", None)
+    os.environ.setdefault("DISCORD_TOKEN", "loadtest")
+    if args.ttl is not None:
+        for tab in TABS:
+            os.environ[f"{tab}_TTL"] = str(args.ttl)
+    import bot
+
+    bot.sheet_cache.remove_listener(bot.live_boards)  # needs a logged-in client
+    if args.warm:
+        await bot.sheet_cache.get_many(TABS)
+    if args.refresher:
+        bot.refresher.start()
+    bot.lag_monitor.watch_commands(bot.bot.walk_commands())
+    bot.lag_monitor.start()
+    lag = LagSampler()
+    lag.start()
+
+    workload = Workload(sheets, args.mix, args.seed)
+    latencies = {command: [] for command in args.mix}
+    outcomes = {command: Counter() for command in args.mix}
+    churn_random = random.Random(args.seed)
+
+    async def fire():
+        command, pos, kw = workload.next()
+        ctx = FakeContext(workload.random.randrange(1 << 60), workload.random.randrange(args.guilds),
+                          args.send_latency)
+        started = time.perf_counter()
+        try:
+            await bot.bot.get_command(command).callback(ctx, *pos, **kw)
+        except Exception as e:
+            outcomes[command][f"raised {type(e).__name__}"] += 1
+            return
+        latencies[command].append(time.perf_counter() - started)
+        reply = ctx.replies[-1] if ctx.replies else ""
+        if reply == bot.BUSY_REPLY:
+            outcomes[command]["busy"] += 1
+        elif reply.startswith("⚠️ Error"):
+            outcomes[command]["error"] += 1
+        else:
+            outcomes[command]["ok"] += 1
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    end = started + args.duration
+    inflight = set()
+    dropped = 0
+
+    async def churner():
+        while True:
+            await asyncio.sleep(args.churn)
+            churn(sheets, churn_random)
+
+    churn_task = asyncio.create_task(churner()) if args.churn else None
+    try:
+        if args.rate:
+            # Open loop: arrivals keep coming whether or not earlier commands finished
+            arrivals = random.Random(args.seed)
+            next_at = started
+            while True:
+                next_at += arrivals.expovariate(args.rate)
+                if next_at >= end:
+                    break
+                await asyncio.sleep(max(next_at - loop.time(), 0))
+                if len(inflight) >= args.concurrency:
+                    dropped += 1
+                    continue
+                task = asyncio.ensure_future(fire())
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+            await asyncio.gather(*inflight)
+        else:
+            async def user():
+                while loop.time() < end:
+                    await fire()
+            await asyncio.gather(*(user() for _ in range(args.concurrency)))
+        elapsed = loop.time() - started
+    finally:
+        if churn_task is not None:
+            churn_task.cancel()
+        await lag.stop()
+        await bot.lag_monitor.stop()
+        await bot.refresher.stop()
+        await bot.public_sheet.close()
+        await runner.cleanup()
+
+    total = Counter()
+    for counts in outcomes.values():
+        total.update(counts)
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "elapsed": elapsed,
+        "commands": sum(total.values()),
+        "commands_per_second": sum(total.values()) / elapsed if elapsed else 0.0,
+        "outcomes": dict(total),
+        "dropped": dropped,
+        "per_command": {
+            command: {**summarize(latencies[command]), "outcomes": dict(outcomes[command])}
+            for command in args.mix if outcomes[command]
+        },
+        "loop_lag": {**summarize(lag.samples), "stalls": bot.lag_monitor.report()["worst_offenders"]},
+        "standin_requests": standin.stats,
+        "sheet_fetches": {
+            "/".join(key): value for key, value in metrics.SHEET_FETCHES.samples()},
+        "sheet_cache": dict(bot.sheet_cache.stats),
+        "render_cache": dict(bot.render_cache.stats),
+        "coalesced": sum(value for _, value in metrics.COMMANDS_COALESCED.samples()),
+        "shed": {"/".join(key): value for key, value in metrics.COMMANDS_SHED.samples()},
+    }
+
+
+# -------------------- Report --------------------
+def print_report(result):
+    ms = 1000
+    print(f"{result['commands']} commands in {result['elapsed']:.1f}s = "
+          f"{result['commands_per_second']:.1f} cmd/s  {result['outcomes']}"
+          + (f"  dropped at the concurrency cap: {result['dropped']}" if result["dropped"] else ""))
+    print()
+    print(f"{'command':<12} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}  outcomes")
+    for command, s in result["per_command"].items():
+        print(f"{command:<12} {s['count']:>7} {s['p50'] * ms:>9.2f} {s['p90'] * ms:>9.2f} "
+              f"{s['p99'] * ms:>9.2f} {s['max'] * ms:>9.2f}  {s['outcomes']}")
+    print()
+    lag = result["loop_lag"]
+    print(f"event loop lag: p50 {lag['p50'] * ms:.2f}ms  p99 {lag['p99'] * ms:.2f}ms  max {lag['max'] * ms:.2f}ms"
+          f"  ({lag['count']} samples)")
+    for stall in lag["stalls"]:
+        print(f"  stalls in {stall['command']}: {stall['stalls']}, worst {stall['worst'] * ms:.0f}ms")
+    print()
+    print("stand-in sheet requests:")
+    for tab, s in sorted(result["standin_requests"].items()):
+        print(f"  {tab:<12} {s['requests']:>6} requests  {s['not_modified']:>6} not modified  "
+              f"{s['errors']:>4} errors  {s['rate_limited']:>4} rate limited  {s['bytes'] / 1e6:8.2f} MB")
+    print(f"client fetches (sheet/status): {result['sheet_fetches']}")
+    print(f"sheet cache: {result['sheet_cache']}")
+    print(f"render cache: {result['render_cache']}")
+    print(f"coalesced: {result['coalesced']}  shed: {result['shed']}")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        command, _, weight = part.partition("=")
+        if command.strip() not in MIX:
+            raise argparse.ArgumentTypeError(f"unknown command {command.strip()!r}")
+        mix[command.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load")
+    parser.add_argument("--rate", type=float, default=0, help="commands per second (open loop); 0 = closed loop")
+    parser.add_argument("--concurrency", type=int, default=32,
+                        help="concurrent users (closed loop) or cap on commands in flight (open loop)")
+    parser.add_argument("--mix", type=parse_mix, default=MIX, help="command weights, e.g. player=5,standings=1")
+    parser.add_argument("--guilds", type=int, default=20, help="guilds the commands are spread over")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="seconds each reply takes to send")
+    parser.add_argument("--churn", type=float, default=0, help="edit the sheet every this many seconds")
+    parser.add_argument("--ttl", type=int, default=None, help="override every tab's cache TTL")
+    parser.add_argument("--warm", action="store_true", help="load every tab before the clock starts")
+    parser.add_argument("--no-refresher", dest="refresher", action="store_false",
+                        help="do not run the background refresher")
+    parser.add_argument("--teams", type=int, default=9)
+    parser.add_argument("--players", type=int, default=4, help="players per team")
+    parser.add_argument("--matchups", type=int, default=None, help="matchups on the MATCHES tab")
+    parser.add_argument("--reject-queries", action="store_true",
+                        help="stand-in answers every tq query with 400 (client-side filtering)")
+    add_fault_args(parser)
+    parser.add_argument("--seed", type=int, default=2025)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
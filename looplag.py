@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from metrics import LOOP_LAG, LOOP_LAG_LAST, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """Measures event-loop scheduling lag and finds out who caused it.
+
+    An async task times how late a sleep wakes up. Next to it, a watchdog
+    thread notices when that task's heartbeat is overdue by more than
+    ``stall_threshold`` seconds and, while the loop is still stuck, looks at the
+    loop thread's stack to see which command callback is running. Stalls are
+    logged and aggregated per command (see ``report``).
+
+    With ``debug=True`` the full stack of every blocking call is logged as well
+    and asyncio's own debug mode reports slow callbacks.
+    """
+
+    def __init__(self, interval=0.5, stall_threshold=0.25, debug=False):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.debug = debug
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.offenders = {}
+        self.recent = deque(maxlen=20)
+        self._commands = {}
+        self._active = {}
+        self._suspect = None
+        self._heartbeat = time.monotonic()
+        self._loop = None
+        self._loop_thread = None
+        self._task = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    # -------------------- Command Tracking --------------------
+    def watch_commands(self, commands):
+        """Remember the callbacks of the bot's commands so stalls can be attributed"""
+        for command in commands:
+            self._commands[command.callback.__code__] = command.qualified_name
+
+    def command_started(self, name):
+        self._active[asyncio.current_task()] = name
+
+    def command_finished(self):
+        self._active.pop(asyncio.current_task(), None)
+
+    # -------------------- Lifecycle --------------------
+    def start(self):
+        """Start sampling; safe to call again on reconnect"""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        if self.debug:
+            self._loop.set_debug(True)
+            self._loop.slow_callback_duration = self.stall_threshold
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._run(), name="loop-lag-monitor")
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - started - self.interval, 0.0)
+            self._heartbeat = time.monotonic()
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG.observe(lag)
+            LOOP_LAG_LAST.set(lag)
+            if lag > self.stall_threshold:
+                self._record_stall(lag, self._suspect)
+            self._suspect = None
+
+    # -------------------- Watchdog Thread --------------------
+    def _watch(self):
+        poll = max(self.stall_threshold / 2, 0.05)
+        while not self._stopping.wait(poll):
+            overdue = time.monotonic() - self._heartbeat - self.interval
+            if overdue > self.stall_threshold and self._suspect is None:
+                try:
+                    self._suspect = self._identify()
+                except Exception:
+                    logger.exception("Loop watchdog could not inspect the event loop")
+
+    def _identify(self):
+        """Returns (command name, blocking call site, stack) for the stuck loop thread"""
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return None
+
+        stack = traceback.extract_stack(frame)
+        where = f"{stack[-1].filename}:{stack[-1].lineno} in {stack[-1].name}" if stack else "?"
+
+        # Innermost command callback on the stack is the culprit
+        name = None
+        f = frame
+        while f is not None and name is None:
+            name = self._commands.get(f.f_code)
+            f = f.f_back
+        if name is None:
+            name = self._active.get(asyncio.current_task(self._loop))
+        return name, where, "".join(stack.format()) if self.debug else None
+
+    def _record_stall(self, lag, suspect):
+        name, where, stack = suspect or (None, "?", None)
+        name = name or "unknown"
+
+        stats = self.offenders.setdefault(name, {"stalls": 0, "total": 0.0, "worst": 0.0})
+        stats["stalls"] += 1
+        stats["total"] += lag
+        stats["worst"] = max(stats["worst"], lag)
+        self.recent.append({"command": name, "lag": round(lag, 3), "where": where, "at": time.time()})
+        LOOP_STALLS.inc(command=name)
+
+        logger.warning(f"Event loop stalled {lag * 1000:.0f}ms while running {name} ({where})")
+        if stack:
+            logger.warning(f"Blocking call made from {name}:\n{stack}")
+
+    def report(self, top=5):
+        """Summary for the health endpoint: current lag and the worst offenders"""
+        worst = sorted(self.offenders.items(), key=lambda item: item[1]["worst"], reverse=True)
+        return {
+            "loop_lag": round(self.last_lag, 4),
+            "max_loop_lag": round(self.max_lag, 4),
+            "stall_threshold": self.stall_threshold,
+            "worst_offenders": [
+                {"command": name, "stalls": s["stalls"], "worst": round(s["worst"], 3), "total": round(s["total"], 3)}
+                for name, s in worst[:top]
+            ],
+            "recent_stalls": list(self.recent)[-top:],
+        }
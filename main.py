@@ -1,81 +1,119 @@
+import asyncio
 import os
-from threading import Thread
-from time import sleep
-import requests
+import signal
 import logging
 
-from flask import Flask
-from bot import bot  # your Discord bot from bot.py
+from aiohttp import web, ClientError, ClientSession, ClientTimeout
+from bot import bot, lag_monitor, load_saved_snapshot  # your Discord bot from bot.py
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# -------------------- Flask Web Server --------------------
-app = Flask(__name__)
+# Everything (web server, keep-alive and the Discord client) runs on one event loop
 
-@app.route("/")
-def home():
+# -------------------- Web Server --------------------
+async def home(request):
     logger.info("Health check ping received")
-    return "Bot is alive", 200
+    return web.Response(text="Bot is alive")
 
-@app.route("/health")
-def health():
-    return "OK", 200
+async def health(request):
+    """Always 200 while the process is up; the body reports event-loop stalls"""
+    return web.json_response({"status": "OK", **lag_monitor.report()})
 
-def run_webserver():
-    """Run Flask in a separate thread"""
-    port = int(os.environ.get("PORT", 10000))
-    logger.info(f"Starting web server on port {port}")
-    # Use debug=False and don't use reloader to avoid threads issues
-    app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
+async def metrics_endpoint(request):
+    """Prometheus text exposition of the bot's metrics"""
+    return web.Response(
+        text=metrics.REGISTRY.render(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+def create_app():
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_endpoint)
+    return app
 
-# Start web server in a daemon thread
-webserver_thread = Thread(target=run_webserver, daemon=True)
-webserver_thread.start()
-logger.info("Web server thread started")
+async def start_webserver():
+    """Start the HTTP server on the current event loop"""
+    port = int(os.environ.get("PORT", 10000))
+    runner = web.AppRunner(create_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    logger.info(f"Web server started on port {port}")
+    return runner
 
 # -------------------- Keep Alive (Self-ping) --------------------
-def keep_alive():
+async def keep_alive():
     """Ping the bot's own URL to keep it awake (for Render free tier)"""
     url = os.environ.get("WEB_URL")
     if not url:
         logger.warning("WEB_URL not set - keep-alive disabled")
         return
-    
-    logger.info(f"Keep-alive thread started, pinging {url} every 240 seconds")
-    
+
     # Ensure URL has proper format
     if not url.startswith(("http://", "https://")):
         url = "https://" + url
-    
+
+    logger.info(f"Keep-alive started, pinging {url} every 240 seconds")
+
     ping_count = 0
-    while True:
-        try:
-            sleep(240)  # Wait 4 minutes between pings
-            response = requests.get(url, timeout=30)
-            ping_count += 1
-            logger.info(f"Keep-alive ping #{ping_count}: Status {response.status_code}")
-        except requests.exceptions.Timeout:
-            logger.warning(f"Keep-alive ping #{ping_count} timed out")
-        except requests.exceptions.ConnectionError:
-            logger.warning(f"Keep-alive ping #{ping_count} connection error")
-        except Exception as e:
-            logger.error(f"Keep-alive ping #{ping_count} failed: {e}")
-
-# Start keep-alive in a daemon thread
-keep_alive_thread = Thread(target=keep_alive, daemon=True)
-keep_alive_thread.start()
-logger.info("Keep-alive thread started")
+    async with ClientSession(timeout=ClientTimeout(total=30)) as session:
+        while True:
+            await asyncio.sleep(240)  # Wait 4 minutes between pings
+            try:
+                async with session.get(url) as response:
+                    ping_count += 1
+                    logger.info(f"Keep-alive ping #{ping_count}: Status {response.status}")
+            except asyncio.TimeoutError:
+                logger.warning(f"Keep-alive ping #{ping_count} timed out")
+            except ClientError as e:
+                logger.warning(f"Keep-alive ping #{ping_count} connection error: {e}")
+            except Exception as e:
+                logger.error(f"Keep-alive ping #{ping_count} failed: {e}")
 
 # -------------------- Run Discord Bot --------------------
-TOKEN = os.environ.get("DISCORD_TOKEN")
-if not TOKEN:
-    raise ValueError("DISCORD_TOKEN not set!")
-
-logger.info("Starting Discord bot...")
-try:
-    bot.run(TOKEN)
-except Exception as e:
-    logger.error(f"Discord bot crashed: {e}")
-    raise
+async def main():
+    TOKEN = os.environ.get("DISCORD_TOKEN")
+    if not TOKEN:
+        raise ValueError("DISCORD_TOKEN not set!")
+
+    # Serve the last saved sheet data right away instead of waiting on Google
+    load_saved_snapshot()
+
+    runner = await start_webserver()
+    keep_alive_task = asyncio.create_task(keep_alive(), name="keep-alive")
+
+    # Shut down cleanly on SIGINT/SIGTERM (Render sends SIGTERM on deploys)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # not supported on Windows
+
+    logger.info("Starting Discord bot...")
+    bot_task = asyncio.create_task(bot.start(TOKEN), name="discord-bot")
+    stop_task = asyncio.create_task(stop.wait(), name="stop-signal")
+    try:
+        done, _ = await asyncio.wait({bot_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+        if bot_task in done:
+            bot_task.result()  # re-raise if the bot crashed
+    except Exception as e:
+        logger.error(f"Discord bot crashed: {e}")
+        raise
+    finally:
+        logger.info("Shutting down...")
+        stop_task.cancel()
+        keep_alive_task.cancel()
+        await bot.close()
+        bot_task.cancel()
+        await asyncio.gather(bot_task, keep_alive_task, return_exceptions=True)
+        await runner.cleanup()
+        logger.info("Shutdown complete")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,219 @@
+import math
+import threading
+
+# Minimal Prometheus-style metrics: counters, gauges and histograms with labels,
+# rendered in the text exposition format served on /metrics.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value != value:  # NaN
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.samples():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """Mirrors a running total kept elsewhere (e.g. a stats dict); it must only grow"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [count per bucket..., sum, count]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            return [(key, list(state)) for key, state in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, state in self.samples():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class Registry:
+    """Holds every metric plus collectors that refresh gauges right before a scrape"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, callback):
+        self.collectors.append(callback)
+
+    def render(self):
+        for callback in self.collectors:
+            try:
+                callback()
+            except Exception:
+                pass  # a broken collector must not break the whole scrape
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labelnames=()):
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name, help, labelnames=()):
+    return REGISTRY.register(Gauge(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+# -------------------- Shared Metrics --------------------
+COMMAND_LATENCY = histogram(
+    "bot_command_duration_seconds", "Time from command invocation to completion", ["command"])
+COMMAND_ERRORS = counter(
+    "bot_errors_total", "Errors raised while handling commands, by type", ["command", "type"])
+GATEWAY_LATENCY = gauge(
+    "bot_gateway_latency_seconds", "Discord websocket heartbeat latency")
+LOOP_LAG = histogram(
+    "bot_event_loop_lag_seconds", "How late the event loop ran a scheduled wake-up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+LOOP_LAG_LAST = gauge(
+    "bot_event_loop_lag_last_seconds", "Most recent event loop lag sample")
+LOOP_STALLS = counter(
+    "bot_event_loop_stalls_total", "Event loop stalls over the threshold, by the command that caused them",
+    ["command"])
+COMMAND_QUEUE_DEPTH = gauge(
+    "bot_command_queue_depth", "Commands waiting for an execution slot")
+COMMANDS_RUNNING = gauge(
+    "bot_command_executions_running", "Command executions currently holding a slot")
+COMMANDS_SHED = counter(
+    "bot_commands_shed_total", "Commands answered with a busy reply instead of running, by reason",
+    ["command", "reason"])
+COMMANDS_COALESCED = counter(
+    "bot_commands_coalesced_total", "Commands that shared an identical in-flight execution", ["command"])
+AUTOCOMPLETE_LATENCY = histogram(
+    "bot_autocomplete_duration_seconds", "Time to answer one slash-command autocomplete request", ["option"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+
+SHEET_FETCH_LATENCY = histogram(
+    "sheet_fetch_duration_seconds", "Time to download and tokenize one tab from Google", ["sheet"])
+SHEET_FETCH_BYTES = counter(
+    "sheet_fetch_bytes_total", "CSV bytes downloaded per tab", ["sheet"])
+SHEET_FETCHES = counter(
+    "sheet_fetches_total", "Tab downloads by outcome", ["sheet", "status"])
+SHEET_PARSE_LATENCY = histogram(
+    "sheet_parse_duration_seconds", "Time to build the parsed table of one tab", ["sheet"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+LIVE_SUBSCRIPTIONS = gauge(
+    "bot_live_subscriptions", "Live messages kept up to date by this process")
+LIVE_EDITS = counter(
+    "bot_live_updates_total", "Live message updates after a data change, by outcome", ["board", "outcome"])
+STANDINGS_MISMATCHES = gauge(
+    "bot_standings_mismatches", "Differences between standings computed from MATCHES and the GROUP_STAGE tab")
+SHARED_LEADER = gauge(
+    "bot_shared_snapshot_leader", "1 while this process fetches from Google for all processes, 0 while it follows")
+CACHE_EVENTS = counter(
+    "cache_events_total", "Cache lookups by cache and outcome", ["cache", "event"])
+CACHE_HIT_RATIO = gauge(
+    "cache_hit_ratio", "Share of lookups answered from memory", ["cache"])
+
+
+def watch_cache(name, stats, hit_events=("hits",), lookup_events=("hits", "misses")):
+    """Exports a cache's stats dict (and its hit ratio) on every scrape"""
+    def collect():
+        for event, value in list(stats.items()):
+            CACHE_EVENTS.set_total(value, cache=name, event=event)
+        lookups = sum(stats.get(event, 0) for event in lookup_events)
+        hits = sum(stats.get(event, 0) for event in hit_events)
+        CACHE_HIT_RATIO.set(hits / lookups if lookups else 0.0, cache=name)
+    REGISTRY.add_collector(collect)
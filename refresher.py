@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Refresher:
+    """Background task that keeps the hot tabs warm ahead of demand.
+
+    Each tab is refreshed on its own schedule. While commands are coming in
+    (activity within ``active_window`` seconds) a tab is refreshed every
+    ``interval * active_factor`` seconds, so the cache never goes stale on the
+    critical path. When the bot is idle the interval doubles for every further
+    ``active_window`` of silence, up to ``max_interval``; the first command
+    after a quiet period wakes every tab up again. Failed refreshes retry with
+    jittered exponential backoff.
+    """
+
+    def __init__(self, cache, intervals, active_window=300, active_factor=0.5,
+                 max_interval=900, max_backoff=600):
+        self.cache = cache
+        self.intervals = dict(intervals)
+        self.active_window = active_window
+        self.active_factor = active_factor
+        self.max_interval = max_interval
+        self.max_backoff = max_backoff
+        self.last_activity = time.monotonic()
+        self.failures = {}
+        self._wake = asyncio.Event()
+        self._tasks = []
+
+    def note_activity(self):
+        """Called for every command; wakes idle tabs up early"""
+        now = time.monotonic()
+        was_idle = now - self.last_activity >= self.active_window
+        self.last_activity = now
+        if was_idle:
+            self._wake.set()
+            self._wake.clear()
+
+    def next_delay(self, sheet_name):
+        base = self.intervals[sheet_name]
+        failures = self.failures.get(sheet_name, 0)
+        if failures:
+            # Jittered exponential backoff: somewhere in [delay/2, delay]
+            delay = min(base * 2 ** failures, self.max_backoff)
+            return random.uniform(delay / 2, delay)
+
+        idle_for = time.monotonic() - self.last_activity
+        if idle_for < self.active_window:
+            return base * self.active_factor
+        return min(base * 2 ** int(idle_for // self.active_window), self.max_interval)
+
+    def start(self):
+        """Start one refresh loop per tab; safe to call again on reconnect"""
+        if self._tasks:
+            return
+        for sheet_name in self.intervals:
+            self._tasks.append(asyncio.create_task(self._run(sheet_name), name=f"refresh-{sheet_name}"))
+        logger.info(f"Background refresher started for {', '.join(self.intervals)}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, sheet_name):
+        while True:
+            try:
+                await self.cache.refresh(sheet_name)
+                self.failures.pop(sheet_name, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures[sheet_name] = self.failures.get(sheet_name, 0) + 1
+                logger.warning(f"Background refresh of {sheet_name} failed "
+                               f"({self.failures[sheet_name]} in a row): {e!r}")
+
+            delay = self.next_delay(sheet_name)
+            if self.failures.get(sheet_name):
+                await asyncio.sleep(delay)  # activity must not cut a backoff short
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,290 @@
+from collections import OrderedDict
+
+from analytics import FORM_GAMES, TeamStats
+from tournament import LEADERBOARD_DEPTH
+
+# Pure functions that turn a Snapshot into the text of a command reply.
+# They never touch the network, so their output can be cached per snapshot version.
+
+MEDALS = ["🥇", "🥈", "🥉"]
+MAX_MESSAGE = 2000  # Discord rejects longer messages
+
+
+def _blank(value):
+    """Shows a missing number (e.g. an unplayed game) as an empty cell"""
+    return "" if value is None else value
+
+
+def _rank(i):
+    return MEDALS[i-1] if i <= 3 else f"{i}."
+
+
+def leaderboard_title(emoji, label, page, limit):
+    """'TOP 10 GOALSCORERS' on the first page, 'GOALSCORERS #11-20' after that"""
+    if page == 1:
+        return f"**{emoji} TOP {limit} {label} {emoji}**"
+    start = (page - 1) * limit
+    return f"**{emoji} {label} #{start + 1}-{start + limit} {emoji}**"
+
+
+def no_page(page, start, total):
+    """Reply for a leaderboard page past the end; only LEADERBOARD_DEPTH players are ranked"""
+    if start >= LEADERBOARD_DEPTH and total > LEADERBOARD_DEPTH:
+        return f"❌ Only the top {LEADERBOARD_DEPTH} players are ranked, so there is no page {page}."
+    return f"❌ There is no page {page}."
+
+
+def did_you_mean(suggestions):
+    if not suggestions:
+        return ""
+    return " Did you mean " + ", ".join(f"**{s}**" for s in suggestions) + "?"
+
+
+def player(snap, name):
+    p = snap.players.resolve(name)
+    if not p:
+        return f"❌ Player '{name}' not found." + did_you_mean(snap.players.suggest(name))
+
+    return (
+        f"**{p.name}** ({p.team})\n"
+        f"Games: {p.gp} | Goals: {p.goals} | Assists: {p.assists}"
+    )
+
+
+def standings(snap, page, limit):
+    ranked = snap.standings.ranked
+    if not ranked:
+        return "❌ No team data found."
+
+    start = (page - 1) * limit
+    rows = ranked[start:start + limit]
+    if not rows:
+        return f"❌ There is no page {page}."
+
+    lines = [
+        "**🏆 WORLD CUP 2025 STANDINGS 🏆**",
+        "```" + f"{'Rank':<5}{'Team':<12}{'GP':<4}{'W':<4}{'D':<4}{'L':<4}{'GF':<4}{'GA':<4}{'GD':<5}{'PTS':<5}",
+        "-" * 55,
+    ]
+    for i, t in enumerate(rows, start=start + 1):
+        lines.append(f"{i:<5}{t.team[:10]:<12}{t.gp:<4}{t.w:<4}{t.d:<4}{t.l:<4}{t.gf:<4}{t.ga:<4}{t.gd:<5}{t.pts:<5}")
+    return "\n".join(lines) + "\n```"
+
+
+def team(snap, team_name):
+    roster = snap.players.roster(team_name)
+    if not roster:
+        resolved = snap.players.resolve_team(team_name)
+        if not resolved:
+            return f"⚠️ No players found for **{team_name}**." + did_you_mean(snap.players.suggest_team(team_name))
+        team_name, roster = resolved, snap.players.roster(resolved)
+
+    lines = [f"**🏒 {team_name.upper()} TEAM SUMMARY 🏒**", "", "__Players:__"]
+    lines.extend(f"{p.name}: {p.gp} GP | {p.goals} G | {p.assists} A" for p in roster)
+    lines.append("")
+
+    totals = snap.standings.find(team_name)
+    if totals:
+        lines.append("__Team Totals:__")
+        lines.append(f"**GP:** {totals.gp} | **W:** {totals.w} | **D:** {totals.d} | **L:** {totals.l}")
+        lines.append(f"**GF:** {totals.gf} | **GA:** {totals.ga} | **GD:** {totals.gd} | **PTS:** {totals.pts}")
+    else:
+        lines.append("_No team totals found in the standings._")
+    return "\n".join(lines)
+
+
+def topscorers(snap, page, limit):
+    start = (page - 1) * limit
+    rows = snap.players.top_scorers[start:start + limit]
+    if not rows and page > 1:
+        return no_page(page, start, len(snap.players.players))
+
+    lines = [leaderboard_title("⚽", "GOALSCORERS", page, limit)]
+    for i, p in enumerate(rows, start=start + 1):
+        lines.append(f"{_rank(i)} {p.name} ({p.team}) - {p.goals} G, {p.assists} A, {p.gp} GP")
+    return "\n".join(lines) + "\n"
+
+
+def assists(snap, page, limit):
+    start = (page - 1) * limit
+    rows = snap.players.top_assists[start:start + limit]
+    if not rows and page > 1:
+        return no_page(page, start, len(snap.players.players))
+
+    lines = [leaderboard_title("🅰️", "ASSIST LEADERS", page, limit)]
+    for i, p in enumerate(rows, start=start + 1):
+        lines.append(f"{_rank(i)} {p.name} ({p.team}) - {p.assists} A, {p.goals} G, {p.gp} GP")
+    return "\n".join(lines) + "\n"
+
+
+def matchlink(snap, team1, team2):
+    positions = snap.matches.find(team1, team2)
+    if not positions:
+        return f"❌ No match found for {team1} vs {team2}"
+
+    game = snap.matches.games[positions[0]]
+    link = game.link or "No link available"
+    return f"🎥 {link}\nMatch: **{game.team1} vs {game.team2}**"
+
+
+def stats(snap, name):
+    analytics = snap.matches.analytics
+    found = analytics.lookup(name)
+    if found is None:
+        return f"❌ No match stats found for '{name}'." + did_you_mean(analytics.suggest(name))
+
+    if isinstance(found, TeamStats):
+        t = found
+        return (
+            f"**📊 {t.name}** - {t.games} games\n"
+            f"**W:** {t.w} | **D:** {t.d} | **L:** {t.l}\n"
+            f"**GF:** {t.gf} ({t.gf / t.games:.2f}/game) | **GA:** {t.ga} ({t.ga / t.games:.2f}/game)\n"
+            f"**Form:** {t.form() or '-'}"
+        )
+    p = found
+    return (
+        f"**📊 {p.name}** ({p.team}) - {p.games} games\n"
+        f"Goals: {p.goals} ({p.goals_per_game:.2f}/game) | Assists: {p.assists} ({p.assists_per_game:.2f}/game)"
+    )
+
+
+def h2h(snap, team1, team2):
+    record = snap.matches.analytics.h2h(team1, team2)
+    if record is None:
+        return f"❌ No played games found for {team1} vs {team2}"
+
+    lines = [
+        f"**⚔️ {record.team1} vs {record.team2}** - {len(record.results)} games",
+        f"{record.team1} wins: {record.wins1} | Draws: {record.draws} | {record.team2} wins: {record.wins2}",
+        f"Goals: {record.goals1} - {record.goals2}",
+        "Scores: " + ", ".join(f"{s1}-{s2}" for s1, s2 in record.results[-FORM_GAMES:]),
+    ]
+    return "\n".join(lines)
+
+
+def _game_line(line):
+    return f"{line.player} (G:{_blank(line.goals)}, A:{_blank(line.assists)})"
+
+
+def matchinfo(snap, team1, team2):
+    positions = snap.matches.find(team1, team2)
+    if not positions:
+        return f"❌ No match found for {team1} vs {team2}"
+
+    # The matchup's first row plus the 3 rows after it make up the 4 games
+    games = snap.matches.games
+    found_index = positions[0]
+    sheet_team1, sheet_team2 = games[found_index].team1, games[found_index].team2
+
+    msg_lines = [f"📊 Match Info: **{sheet_team1} vs {sheet_team2}**\n"]
+    for offset, game in enumerate(games[found_index:found_index + 4], start=1):
+        if not game.complete:
+            continue
+        msg_lines.append(
+            f"🎮 Game {offset}:\n"
+            f"  {sheet_team1} — {', '.join(_game_line(line) for line in game.lines1)}\n"
+            f"  {sheet_team2} — {', '.join(_game_line(line) for line in game.lines2)}\n"
+            f"  🏆 Score: {sheet_team1} {_blank(game.score1)} — {sheet_team2} {_blank(game.score2)}\n"
+        )
+    return "\n".join(msg_lines)
+
+
+# -------------------- History --------------------
+def _when(timestamp):
+    """Discord timestamp markup: shown in each reader's own time zone"""
+    return f"<t:{int(timestamp)}:f>"
+
+
+def history_player(name, series):
+    if not series:
+        return f"❌ No recorded history for player '{name}'."
+    latest = series[-1][1]
+    lines = [f"**📈 {latest.name} ({latest.team}) over time**"]
+    lines.extend(f"{_when(t)} — {p.gp} GP | {p.goals} G | {p.assists} A" for t, p in series)
+    return "\n".join(lines)
+
+
+def history_standings(snap, when, page, limit):
+    if snap.standings is None:
+        return f"❌ No standings had been recorded by {_when(when)}."
+    return f"_As of {_when(when)}_\n" + standings(snap, page, limit)
+
+
+def history_changes(events, per_line=4):
+    """``events`` as returned by history.standings_changes, shown newest first"""
+    if not events:
+        return "❌ No standings changes recorded yet."
+    lines = ["**🕒 STANDINGS CHANGES 🕒**"]
+    for timestamp, moves in reversed(events):
+        parts = []
+        for team, old_rank, rank, old_pts, pts in moves[:per_line]:
+            if old_rank is None:
+                parts.append(f"{team} in at {rank} ({pts} pts)")
+            elif old_rank != rank:
+                parts.append(f"{team} {old_rank}→{rank} ({pts} pts)")
+            else:
+                parts.append(f"{team} {old_pts}→{pts} pts")
+        more = f" and {len(moves) - per_line} more" if len(moves) > per_line else ""
+        lines.append(f"{_when(timestamp)} " + ", ".join(parts) + more)
+
+    # Newest first, so the oldest changes are the ones left out to fit one message
+    text = "\n".join(lines)
+    if len(text) > MAX_MESSAGE:
+        note = "_Older changes left out._"
+        size = len(text) + 1 + len(note)
+        while len(lines) > 2 and size > MAX_MESSAGE:
+            size -= len(lines.pop()) + 1
+        text = "\n".join(lines + [note])[:MAX_MESSAGE]
+    return text
+
+
+# -------------------- Render Cache --------------------
+class RenderCache:
+    """LRU cache of rendered replies keyed by (command, normalized args, snapshot version).
+
+    Replies rendered from an older snapshot can never be served again, so the
+    whole cache is dropped as soon as a newer version shows up. ``max_bytes``
+    caps the total UTF-8 size of the cached text.
+    """
+
+    def __init__(self, max_entries=512, max_bytes=2_000_000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version = None
+        self.size = 0
+        self._entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, command, args, version):
+        if version != self.version:
+            self.clear(version)
+        key = (command, args, version)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[0]
+
+    def put(self, command, args, version, msg):
+        if version != self.version:
+            self.clear(version)
+        key = (command, args, version)
+        size = len(msg.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        self._entries[key] = (msg, size)
+        self.size += size
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size -= evicted
+            self.stats["evictions"] += 1
+
+    def clear(self, version=None):
+        self._entries.clear()
+        self.size = 0
+        self.version = version
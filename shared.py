@@ -0,0 +1,162 @@
+import asyncio
+import fcntl
+import logging
+import os
+
+from metrics import SHARED_LEADER
+from sheets import SheetPayload
+from store import SnapshotFormatError, parse_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Several bot processes (e.g. one per group of Discord shards) on one box can
+# share a single copy of the sheet data. The process holding an exclusive lock
+# on the lock file is the leader: it alone talks to Google and publishes every
+# change to the snapshot file (see store.SnapshotSaver). The others follow that
+# file instead of the network, and take over when the leader's lock goes away.
+
+
+class LeaderLock:
+    """Non-blocking exclusive flock on a file; the kernel drops it when the holder dies"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class SnapshotReader:
+    """Follower-side stand-in for PublicSheet: "downloads" tabs from the snapshot file.
+
+    The file is only read and decoded again when it has been replaced (new
+    inode, size or mtime), so polling it is a single stat; the decoding runs in
+    a worker thread, once for all the tabs asking at the same time. The stored
+    rows are already projected by the leader, so ``spec`` is ignored. The tab's
+    digest doubles as its ETag, which lets SheetCache skip unchanged tabs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._stamp = None
+        self._tabs = {}
+        self._loading = None
+
+    async def _load(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            raise LookupError(f"no shared snapshot at {self.path} yet") from None
+        if (st.st_ino, st.st_size, st.st_mtime_ns) == self._stamp:
+            return self._tabs
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._reload())
+        return await asyncio.shield(self._loading)
+
+    async def _reload(self):
+        loop = asyncio.get_running_loop()
+        try:
+            self._stamp, self._tabs = await loop.run_in_executor(None, self._read)
+        finally:
+            self._loading = None
+        return self._tabs
+
+    def _read(self):
+        """(stamp, tabs) of the file as it is now; runs in a worker thread"""
+        try:
+            with open(self.path, "rb") as f:
+                st = os.fstat(f.fileno())
+                data = f.read()
+        except FileNotFoundError:
+            raise LookupError(f"no shared snapshot at {self.path} yet") from None
+        if not data:
+            raise SnapshotFormatError("file is empty")
+        return (st.st_ino, st.st_size, st.st_mtime_ns), parse_snapshot(data)["tabs"]
+
+    async def fetch(self, sheet_name, etag=None, last_modified=None, spec=None):
+        state = (await self._load()).get(sheet_name)
+        if state is None:
+            raise LookupError(f"{sheet_name} has not been published by the leader yet")
+        digest = state["digest"].hex()
+        if etag == digest:
+            return SheetPayload(None, etag, last_modified, not_modified=True)
+        return SheetPayload(state["rows"], digest, state["last_modified"])
+
+    async def close(self):
+        pass
+
+
+class SharedSnapshot:
+    """Decides whether this process fetches from Google or follows the leader.
+
+    ``start`` takes the lock if it is free; otherwise the cache is pointed at a
+    SnapshotReader and the lock is retried every ``poll`` seconds. Becoming the
+    leader swaps the real sheet back in and starts publishing with ``saver``.
+    """
+
+    def __init__(self, cache, sheet, saver, path, lock_path=None, poll=5):
+        self.cache = cache
+        self.sheet = sheet
+        self.saver = saver
+        self.lock = LeaderLock(lock_path or f"{path}.lock")
+        self.reader = SnapshotReader(path)
+        self.poll = poll
+        self._task = None
+
+    @property
+    def leader(self):
+        return self.lock.held
+
+    def start(self):
+        """Pick a role; safe to call again on reconnect"""
+        if self._task is not None or self.lock.held:
+            return
+        if self.lock.try_acquire():
+            self._lead()
+        else:
+            logger.info(f"Following the shared snapshot at {self.reader.path}")
+            self.cache.sheet = self.reader
+            self.cache.remove_listener(self.saver)
+            SHARED_LEADER.set(0)
+            self._task = asyncio.create_task(self._wait_for_lock(), name="shared-snapshot")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.lock.release()
+
+    def _lead(self):
+        logger.info(f"Leading: fetching from Google and publishing to {self.reader.path}")
+        self.cache.sheet = self.sheet
+        self.cache.add_listener(self.saver)
+        SHARED_LEADER.set(1)
+
+    async def _wait_for_lock(self):
+        while not self.lock.try_acquire():
+            await asyncio.sleep(self.poll)
+        self._lead()
+        self._task = None
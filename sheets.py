@@ -0,0 +1,567 @@
+import asyncio
+import codecs
+import csv
+import hashlib
+import logging
+import marshal
+import time
+
+import aiohttp
+
+from metrics import SHEET_FETCH_BYTES, SHEET_FETCH_LATENCY, SHEET_FETCHES, SHEET_PARSE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+SHEET_URL = "https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq"
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def column_letter(index):
+    """0-based column index to its sheet letter (0 -> A, 26 -> AA)"""
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+class TabSpec:
+    """Which part of a tab the bot actually reads.
+
+    Rows ``first_row`` up to (not including) ``last_row`` are kept, and of each
+    only ``columns`` (0-based, in that order). Rows with an empty cell in any of
+    the ``nonempty`` columns are dropped. Cells past the end of a short source
+    row come back as None.
+
+    When ``header_row`` and ``labels`` (column -> expected header text) are
+    given the spec can be pushed down to the gviz endpoint as a ``range``/``tq``
+    query (see ``params``), so Google only sends the wanted cells; ``pushed``
+    is then the spec for parsing that response. The label line gviz sends back
+    is checked against ``labels`` before its rows are trusted.
+    """
+    __slots__ = ("first_row", "last_row", "columns", "header_row", "nonempty", "labels", "_required")
+
+    def __init__(self, columns, first_row=0, last_row=None, header_row=None, nonempty=(), labels=None):
+        self.columns = tuple(columns)
+        self.first_row = first_row
+        self.last_row = last_row
+        self.header_row = header_row
+        self.nonempty = tuple(nonempty)
+        self.labels = dict(labels or {})
+        # Positions of the nonempty columns within a projected row
+        self._required = tuple(self.columns.index(col) for col in self.nonempty)
+
+    def project(self, row):
+        width = len(row)
+        return [row[col] if col < width else None for col in self.columns]
+
+    def keep(self, projected):
+        return all(projected[i] for i in self._required)
+
+    def apply(self, rows):
+        """Client-side projection and filtering of fully downloaded rows"""
+        projected = (self.project(row) for row in rows[self.first_row:self.last_row])
+        return [row for row in projected if self.keep(row)]
+
+    # -------------------- Pushdown --------------------
+    def labels_match(self, row):
+        """Whether a header row (as tokenized, unprojected) carries the expected labels.
+
+        gviz joins several header rows into one label, so each expected label
+        only has to appear in its cell as whole words.
+        """
+        if row is None:
+            return False
+        for col, expected in self.labels.items():
+            words = (row[col] if col < len(row) else "").casefold().split()
+            wanted = expected.casefold().split()
+            if not any(words[i:i + len(wanted)] == wanted for i in range(len(words) - len(wanted) + 1)):
+                return False
+        return True
+
+    @property
+    def pushable(self):
+        return self.header_row is not None and self.header_row < self.first_row and bool(self.labels)
+
+    def params(self):
+        """gviz query parameters that select exactly this spec's cells.
+
+        The range starts at the header row, which gviz turns into the label
+        line of the CSV (``headers=1``), so the response always begins with
+        one line to skip, and to check: should gviz number the rows
+        differently than expected, the labels give it away. Filters are written as ``<> ''`` and so only work on
+        text columns; anything gviz rejects falls back to client-side filtering.
+        """
+        end = f"{column_letter(max(self.columns))}{self.last_row or ''}"
+        query = "select " + ", ".join(column_letter(col) for col in self.columns)
+        if self.nonempty:
+            query += " where " + " and ".join(f"{column_letter(col)} <> ''" for col in self.nonempty)
+        return {"range": f"A{self.header_row + 1}:{end}", "headers": "1", "tq": query}
+
+    def pushed(self):
+        """Spec for parsing the response to ``params``: columns already selected, label line first"""
+        width = len(self.columns)
+        return TabSpec(
+            range(width),
+            first_row=self.first_row - self.header_row,
+            header_row=0,
+            nonempty=self._required,
+            labels={self.columns.index(col): label for col, label in self.labels.items()},
+        )
+
+
+class CsvStream:
+    """Incremental CSV parser: feed it bytes as they arrive, read ``rows`` at the end.
+
+    Records are split on newlines outside quoted fields, so nothing but the
+    current partial line is buffered. With a TabSpec, rows before
+    ``first_row`` are skipped without being tokenized (except the header row,
+    kept whole in ``header``), only the projected columns are kept, and
+    ``feed`` returns True once ``last_row`` is reached so the caller can stop
+    downloading.
+    """
+
+    def __init__(self, spec=None, encoding="utf-8"):
+        self.spec = spec
+        self.rows = []
+        self.header = None
+        self.done = False
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self._pending = ""
+        self._record = []
+        self._quotes = 0
+        self._index = 0
+
+    def feed(self, data):
+        if self.done:
+            return True
+        lines = (self._pending + self._decoder.decode(data)).split("\n")
+        self._pending = lines.pop()
+        self._add_lines(lines)
+        return self.done
+
+    def close(self):
+        """Flush whatever is left and return the rows"""
+        if not self.done:
+            tail = self._pending + self._decoder.decode(b"", final=True)
+            self._pending = ""
+            if tail:
+                self._add_lines([tail])
+            if self._record:  # unterminated quote at the very end
+                self._add_record("".join(self._record))
+        self.done = True
+        return self.rows
+
+    def _add_lines(self, lines):
+        records = []
+        for line in lines:
+            # A record ends on a newline that is outside quotes; an odd running
+            # count of '"' means we are still inside a quoted field
+            self._record.append(line)
+            self._quotes += line.count('"')
+            if self._quotes % 2:
+                self._record.append("\n")
+                continue
+            records.append("".join(self._record))
+            self._record = []
+            self._quotes = 0
+        for record in records:
+            if self._add_record(record):
+                break
+
+    def _add_record(self, record):
+        index = self._index
+        self._index += 1
+        spec = self.spec
+        if spec is None:
+            self.rows.append(next(csv.reader((record,)), []))
+            return False
+        if spec.last_row is not None and index >= spec.last_row:
+            self.done = True
+            return True
+        if index >= spec.first_row:
+            row = spec.project(next(csv.reader((record,)), []))
+            if spec.keep(row):
+                self.rows.append(row)
+        elif index == spec.header_row:
+            self.header = next(csv.reader((record,)), [])
+        return False
+
+
+def parse_csv(data, spec=None, encoding="utf-8"):
+    """Parses a complete CSV payload (bytes) in one go, honoring the TabSpec"""
+    stream = CsvStream(spec, encoding)
+    stream.feed(data)
+    return stream.close()
+
+
+class SheetPayload:
+    """Parsed rows of one tab plus the validators needed to re-request it"""
+    __slots__ = ("rows", "etag", "last_modified", "size", "not_modified", "header")
+
+    def __init__(self, rows, etag=None, last_modified=None, size=0, not_modified=False, header=None):
+        self.rows = rows
+        self.etag = etag
+        self.last_modified = last_modified
+        self.size = size
+        self.not_modified = not_modified
+        self.header = header  # the spec's header row as sent, when the spec has one
+
+    def digest(self):
+        """Hash of the rows actually kept, so edits outside the projection are ignored"""
+        return hashlib.blake2b(marshal.dumps(self.rows), digest_size=16).digest()
+
+
+class RowDiff:
+    """Row-level difference between two versions of a tab.
+
+    ``changed`` maps a row index to its new content (rows that were added or
+    edited); ``length`` is the new row count, so old rows past it were removed.
+    """
+    __slots__ = ("changed", "length", "old_length")
+
+    def __init__(self, changed, length, old_length):
+        self.changed = changed
+        self.length = length
+        self.old_length = old_length
+
+    @classmethod
+    def between(cls, old_rows, new_rows):
+        old_rows = old_rows or []
+        changed = {
+            i: row for i, row in enumerate(new_rows)
+            if i >= len(old_rows) or old_rows[i] != row
+        }
+        return cls(changed, len(new_rows), len(old_rows))
+
+    def apply(self, old_rows):
+        """Rebuilds the new rows from the old ones"""
+        rows = list(old_rows[:self.length])
+        rows.extend([] for _ in range(self.length - len(rows)))
+        for i, row in self.changed.items():
+            rows[i] = row
+        return rows
+
+    @property
+    def removed(self):
+        return max(self.old_length - self.length, 0)
+
+    def __bool__(self):
+        return bool(self.changed) or self.removed > 0
+
+    def __repr__(self):
+        return f"<RowDiff {len(self.changed)} changed, {self.removed} removed>"
+
+
+class PublicSheet:
+    """Async reader for the public gviz CSV export of a Google Sheet.
+
+    All requests share one pooled aiohttp session, so many commands can fetch
+    at once without ever blocking the Discord event loop.
+
+    With ``pushdown`` on, pushable TabSpecs are sent to gviz as a range and
+    query so only the wanted cells are downloaded. A tab whose query gviz
+    rejects, or whose answer does not start with the expected labels, is
+    fetched whole and filtered client-side from then on. ``url``
+    points the reader at another gviz-compatible endpoint (see standin.py).
+    """
+
+    def __init__(self, sheet_id, timeout=10, max_concurrency=8, url=None, pushdown=True):
+        self.sheet_id = sheet_id
+        self.url = url or SHEET_URL.format(sheet_id=sheet_id)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_concurrency = max_concurrency
+        self.pushdown = pushdown
+        self._rejected = set()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+
+    def _get_session(self):
+        # The session has to be created inside the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def fetch(self, sheet_name, etag=None, last_modified=None, spec=None):
+        """Download and parse a tab.
+
+        The body is parsed as it streams in; with a TabSpec only the declared
+        rows and columns are kept and the download stops once the last wanted
+        row has arrived. Pass the validators of the previous payload to make
+        the request conditional; ``payload.not_modified`` is then set on a 304.
+        """
+        if spec is not None and spec.pushable and self.pushdown and sheet_name not in self._rejected:
+            pushed = spec.pushed()
+            try:
+                payload = await self._fetch(sheet_name, etag, last_modified, pushed, spec.params())
+            except aiohttp.ClientResponseError as e:
+                if e.status != 400:
+                    raise
+                self._rejected.add(sheet_name)
+                logger.warning(f"Sheet rejected the query for {sheet_name} ({e.message}); filtering it client-side")
+            else:
+                if payload.not_modified or pushed.labels_match(payload.header):
+                    return payload
+                # The range did not start at the header row: its rows cannot be trusted
+                self._rejected.add(sheet_name)
+                logger.warning(f"Query for {sheet_name} returned labels {payload.header!r} instead of "
+                               f"{list(pushed.labels.values())!r}; filtering it client-side")
+                etag = last_modified = None
+        return await self._fetch(sheet_name, etag, last_modified, spec)
+
+    async def _fetch(self, sheet_name, etag, last_modified, spec, query=None):
+        session = self._get_session()
+        params = {"tqx": "out:csv", "sheet": sheet_name, **(query or {})}
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                async with session.get(self.url, params=params, headers=headers) as response:
+                    if response.status == 304:
+                        SHEET_FETCHES.inc(sheet=sheet_name, status="not_modified")
+                        return SheetPayload(None, etag, last_modified, not_modified=True)
+                    response.raise_for_status()
+                    stream = CsvStream(spec, encoding=response.charset or "utf-8")
+                    size = 0
+                    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                        size += len(chunk)
+                        if stream.feed(chunk):
+                            break  # everything the spec asks for has arrived
+                    payload = SheetPayload(
+                        stream.close(),
+                        response.headers.get("ETag"),
+                        response.headers.get("Last-Modified"),
+                        size=size,
+                        header=stream.header,
+                    )
+            except Exception as e:
+                rate_limited = isinstance(e, aiohttp.ClientResponseError) and e.status == 429
+                SHEET_FETCHES.inc(sheet=sheet_name, status="rate_limited" if rate_limited else "error")
+                raise
+            finally:
+                SHEET_FETCH_LATENCY.observe(time.perf_counter() - started, sheet=sheet_name)
+
+        SHEET_FETCHES.inc(sheet=sheet_name, status="ok")
+        SHEET_FETCH_BYTES.inc(payload.size, sheet=sheet_name)
+        return payload
+
+    async def fetch_many(self, sheet_names, specs=None):
+        """Download several tabs concurrently over the pooled session"""
+        specs = specs or {}
+        payloads = await asyncio.gather(*(self.fetch(name, spec=specs.get(name)) for name in sheet_names))
+        return dict(zip(sheet_names, payloads))
+
+    async def get_worksheet(self, sheet_name, spec=None):
+        """Get worksheet data as list of lists"""
+        payload = await self.fetch(sheet_name, spec=spec)
+        return payload.rows
+
+    async def get_worksheets(self, sheet_names, specs=None):
+        """Get several worksheets at once as {sheet_name: rows}"""
+        payloads = await self.fetch_many(sheet_names, specs)
+        return {name: payload.rows for name, payload in payloads.items()}
+
+    async def close(self):
+        """Close the pooled HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class _CacheEntry:
+    __slots__ = ("value", "rows", "digest", "etag", "last_modified", "fetched_at", "failures", "retry_at")
+
+    def __init__(self, value, rows, digest, etag, last_modified, fetched_at):
+        self.value = value
+        self.rows = rows
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.failures = 0     # failed refreshes in a row
+        self.retry_at = 0.0   # no revalidation before this (monotonic) time after a failure
+
+
+class SheetCache:
+    """Per-tab TTL cache in front of PublicSheet.
+
+    Fresh entries are served straight from memory. Once an entry is older than
+    its TTL the stale copy is still returned immediately while a single
+    background refresh runs (stale-while-revalidate). Concurrent misses for the
+    same tab share one download.
+
+    ``specs`` maps a tab name to the TabSpec of the rows and columns to keep,
+    and ``parsers`` maps it to a function that turns those rows into the
+    cached value, so each download is parsed exactly once. Refreshes are
+    conditional: when the server answers 304 or the hash of the kept rows is
+    unchanged the previous value is kept as-is, without rebuilding it. Otherwise the
+    listeners added with ``add_listener`` get called with the tab name and the
+    RowDiff against the previous rows.
+
+    When a refresh fails the stale copy keeps being served, and the next
+    revalidation waits ``error_ttl`` seconds, doubling with every further
+    failure up to the tab's TTL, so an outage or a 429 does not turn every
+    command into another request to Google.
+    """
+
+    def __init__(self, sheet, ttls=None, default_ttl=60, parsers=None, specs=None, error_ttl=5):
+        self.sheet = sheet
+        self.error_ttl = error_ttl
+        self.parsers = dict(parsers or {})
+        self.specs = dict(specs or {})
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self._entries = {}
+        self._inflight = {}
+        self._listeners = []
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "refreshes": 0, "unchanged": 0, "errors": 0}
+
+    def add_listener(self, callback):
+        """Call ``callback(sheet_name, diff)`` whenever a tab's content changes"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def ttl(self, sheet_name):
+        return self.ttls.get(sheet_name, self.default_ttl)
+
+    async def get(self, sheet_name):
+        """Return the cached worksheet, downloading it only when needed"""
+        entry = self._entries.get(sheet_name)
+        if entry is None:
+            self.stats["misses"] += 1
+            return await self.refresh(sheet_name)
+
+        now = time.monotonic()
+        if now - entry.fetched_at < self.ttl(sheet_name):
+            self.stats["hits"] += 1
+        else:
+            # Serve the stale copy now and revalidate in the background,
+            # unless the last attempt failed too recently
+            self.stats["stale"] += 1
+            if now >= entry.retry_at:
+                self._start_refresh(sheet_name)
+        return entry.value
+
+    async def get_many(self, sheet_names):
+        """Return several tabs at once as {sheet_name: value}.
+
+        Missing tabs are downloaded concurrently, so the wait is the slowest
+        tab rather than the sum of all of them.
+        """
+        values = await asyncio.gather(*(self.get(name) for name in sheet_names))
+        return dict(zip(sheet_names, values))
+
+    def peek(self, sheet_name):
+        """Return the cached worksheet without triggering a download"""
+        entry = self._entries.get(sheet_name)
+        return entry.value if entry is not None else None
+
+    def rows(self, sheet_name):
+        """Return the raw rows behind the cached value"""
+        entry = self._entries.get(sheet_name)
+        return entry.rows if entry is not None else None
+
+    def refresh(self, sheet_name):
+        """Download a tab now; callers arriving meanwhile share the same download"""
+        return asyncio.shield(self._start_refresh(sheet_name))
+
+    async def refresh_many(self, sheet_names):
+        """Download several tabs now, concurrently"""
+        await asyncio.gather(*(self.refresh(name) for name in sheet_names))
+
+    def export(self):
+        """Raw state of every cached tab, as stored in the on-disk snapshot"""
+        return {
+            sheet_name: {
+                "rows": entry.rows,
+                "digest": entry.digest,
+                "etag": entry.etag,
+                "last_modified": entry.last_modified,
+            }
+            for sheet_name, entry in self._entries.items()
+        }
+
+    def prime(self, sheet_name, rows, digest, etag=None, last_modified=None):
+        """Seed a tab from saved state.
+
+        The entry counts as expired, so the first ``get`` serves it right away
+        and revalidates it in the background.
+        """
+        value = self._parse(sheet_name, rows)
+        self._entries[sheet_name] = _CacheEntry(
+            value, rows, digest, etag, last_modified, float("-inf"))
+
+    def _parse(self, sheet_name, rows):
+        parser = self.parsers.get(sheet_name)
+        return parser(rows) if parser is not None else rows
+
+    def _start_refresh(self, sheet_name):
+        task = self._inflight.get(sheet_name)
+        if task is None:
+            task = asyncio.ensure_future(self._load(sheet_name))
+            self._inflight[sheet_name] = task
+            task.add_done_callback(lambda t: self._finish_refresh(sheet_name, t))
+        return task
+
+    async def _load(self, sheet_name):
+        old = self._entries.get(sheet_name)
+        spec = self.specs.get(sheet_name)
+        if old is not None:
+            payload = await self.sheet.fetch(sheet_name, old.etag, old.last_modified, spec=spec)
+        else:
+            payload = await self.sheet.fetch(sheet_name, spec=spec)
+        self.stats["refreshes"] += 1
+
+        digest = None if payload.not_modified else payload.digest()
+        if payload.not_modified or (old is not None and digest == old.digest):
+            # Same content as last time: keep the parsed value (and its indexes)
+            old.fetched_at = time.monotonic()
+            old.failures = 0
+            old.retry_at = 0.0
+            old.etag = payload.etag or old.etag
+            old.last_modified = payload.last_modified or old.last_modified
+            self.stats["unchanged"] += 1
+            return old.value
+
+        started = time.perf_counter()
+        rows = payload.rows
+        value = self._parse(sheet_name, rows)
+        SHEET_PARSE_LATENCY.observe(time.perf_counter() - started, sheet=sheet_name)
+        self._entries[sheet_name] = _CacheEntry(
+            value, rows, digest, payload.etag, payload.last_modified, time.monotonic())
+
+        diff = RowDiff.between(old.rows if old is not None else None, rows)
+        if old is not None:
+            logger.info(f"{sheet_name} changed: {len(diff.changed)} rows changed, {diff.removed} removed")
+        for callback in self._listeners:
+            try:
+                callback(sheet_name, diff)
+            except Exception:
+                logger.exception(f"Listener failed for {sheet_name} update")
+        return value
+
+    def _finish_refresh(self, sheet_name, task):
+        self._inflight.pop(sheet_name, None)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self.stats["errors"] += 1
+            entry = self._entries.get(sheet_name)
+            if entry is None:
+                logger.warning(f"Refreshing {sheet_name} failed: {error!r}")
+                return
+            entry.failures += 1
+            backoff = min(self.error_ttl * 2 ** (entry.failures - 1), max(self.ttl(sheet_name), self.error_ttl))
+            entry.retry_at = time.monotonic() + backoff
+            logger.warning(f"Refreshing {sheet_name} failed ({entry.failures} in a row, "
+                           f"next try in {backoff:.0f}s): {error!r}")
@@ -0,0 +1,195 @@
+"""Local stand-in for the Google Sheets gviz CSV endpoint.
+
+Serves synthetic tabs (see synthetic.py) through the part of gviz the bot
+uses: tqx=out:csv, sheet, range, headers and a tq of the form
+``select C, E [where C <> '' [and ...]]``. Queries outside that subset are
+answered with 400, like gviz does for queries it cannot run, which exercises
+the client-side fallback. Responses carry an ETag and honour If-None-Match.
+Latency, 500s and 429s can be injected to see how the bot copes with a slow
+or throttling Google (see loadtest.py), and --range-shift makes ranges start
+lower than asked, to exercise the bot's check of the returned labels.
+
+    python standin.py --port 8099 --teams 100 --players 8
+    python standin.py --latency 0.5 --jitter 0.5 --error-rate 0.02 --rate-limit-rate 0.05
+    SHEET_ID=x SHEET_URL=http://localhost:8099/gviz/tq python main.py
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import random
+import re
+from io import StringIO
+
+from aiohttp import web
+
+from synthetic import make_sheets
+
+_CELL = re.compile(r"^([A-Z]+)(\d*)$")
+_SELECT = re.compile(r"^select\s+(.+?)(?:\s+where\s+(.+))?$", re.IGNORECASE)
+_NONEMPTY = re.compile(r"^([A-Z]+)\s*<>\s*''$")
+
+
+def column_index(letters):
+    """Sheet letter to 0-based column index (A -> 0, AA -> 26)"""
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - 64
+    return index - 1
+
+
+def parse_range(text, width):
+    """A1-style range such as ``A4:K`` or ``A1:K10`` to (row slice, first col, last col + 1)"""
+    start, _, end = text.upper().partition(":")
+    first, last = _CELL.match(start), _CELL.match(end or start)
+    if not first or not last or not first.group(2):
+        raise ValueError(f"unsupported range {text!r}")
+    rows = slice(int(first.group(2)) - 1, int(last.group(2)) if last.group(2) else None)
+    return rows, column_index(first.group(1)), min(column_index(last.group(1)) + 1, width)
+
+
+def parse_query(text, first_col, last_col):
+    """``select ... [where X <> '' and ...]`` to (selected columns, nonempty columns)"""
+    match = _SELECT.match(text.strip())
+    if not match:
+        raise ValueError(f"unsupported query {text!r}")
+
+    def column(letters):
+        index = column_index(letters.strip().upper())
+        if not first_col <= index < last_col:
+            raise ValueError(f"column {letters.strip()} is outside the range")
+        return index
+
+    selected = [column(letters) for letters in match.group(1).split(",")]
+    nonempty = []
+    if match.group(2):
+        for condition in re.split(r"\s+and\s+", match.group(2).strip(), flags=re.IGNORECASE):
+            cond = _NONEMPTY.match(condition.strip())
+            if not cond:
+                raise ValueError(f"unsupported condition {condition!r}")
+            nonempty.append(column(cond.group(1)))
+    return selected, nonempty
+
+
+class StandinSheet:
+    """Serves ``sheets`` ({sheet_name: rows}) the way gviz exports them.
+
+    Every response waits ``latency`` plus up to ``jitter`` seconds; then a
+    ``rate_limit_rate`` share of requests get a 429 and an ``error_rate``
+    share a 500. Ranges start ``range_shift`` rows lower than asked, as if
+    gviz numbered the rows differently. ``sheets`` may be edited while serving.
+    """
+
+    def __init__(self, sheets, reject_queries=False, latency=0.0, jitter=0.0,
+                 error_rate=0.0, rate_limit_rate=0.0, range_shift=0, seed=None):
+        self.sheets = sheets
+        self.reject_queries = reject_queries
+        self.range_shift = range_shift
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.stats = {}
+        self._random = random.Random(seed)
+
+    def render(self, rows, range_=None, headers=0, query=None):
+        width = max((len(row) for row in rows), default=0)
+        rows = [row + [""] * (width - len(row)) for row in rows]  # gviz output is rectangular
+        first_col, last_col = 0, width
+        if range_:
+            row_slice, first_col, last_col = parse_range(range_, width)
+            shift = self.range_shift
+            rows = rows[row_slice.start + shift:row_slice.stop + shift if row_slice.stop is not None else None]
+
+        columns = list(range(first_col, last_col))
+        nonempty = []
+        if query:
+            if self.reject_queries:
+                raise ValueError("queries are disabled")
+            columns, nonempty = parse_query(query, first_col, last_col)
+
+        out = []
+        if headers:
+            # The header rows become the column labels: one line, cells joined
+            labels = rows[:headers]
+            out.append([" ".join(row[col] for row in labels if row[col]).strip() for col in columns])
+        for row in rows[headers:]:
+            if all(row[col] for col in nonempty):
+                out.append([row[col] for col in columns])
+
+        buf = StringIO()
+        csv.writer(buf, quoting=csv.QUOTE_ALL, lineterminator="\n").writerows(out)
+        return buf.getvalue().encode("utf-8")
+
+    async def handle(self, request):
+        q = request.query
+        sheet_name = q.get("sheet")
+        rows = self.sheets.get(sheet_name)
+        if q.get("tqx") != "out:csv" or rows is None:
+            raise web.HTTPBadRequest(text="Invalid request")
+        try:
+            body = self.render(rows, q.get("range"), int(q.get("headers", 0)), q.get("tq"))
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=f"Invalid query: {e}")
+
+        stats = self.stats.setdefault(
+            sheet_name, {"requests": 0, "bytes": 0, "not_modified": 0, "errors": 0, "rate_limited": 0})
+        stats["requests"] += 1
+        delay = self.latency + self.jitter * self._random.random()
+        if delay:
+            await asyncio.sleep(delay)
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            stats["rate_limited"] += 1
+            raise web.HTTPTooManyRequests(text="Too many requests", headers={"Retry-After": "30"})
+        if roll < self.rate_limit_rate + self.error_rate:
+            stats["errors"] += 1
+            raise web.HTTPInternalServerError(text="Injected error")
+
+        etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            stats["not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        stats["bytes"] += len(body)
+        return web.Response(body=body, content_type="text/csv", charset="utf-8", headers={"ETag": etag})
+
+
+def create_app(sheets, reject_queries=False, **faults):
+    """``faults`` are StandinSheet's latency, jitter, error_rate, rate_limit_rate, range_shift and seed"""
+    standin = StandinSheet(sheets, reject_queries, **faults)
+    app = web.Application()
+    app["standin"] = standin
+    app.router.add_get("/gviz/tq", standin.handle)
+    app.router.add_get("/spreadsheets/d/{sheet_id}/gviz/tq", standin.handle)
+    return app
+
+
+def add_fault_args(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds, at random")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--range-shift", type=int, default=0, help="start every range this many rows lower")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--teams", type=int, default=9)
+    parser.add_argument("--players", type=int, default=4, help="players per team")
+    parser.add_argument("--matchups", type=int, default=None, help="matchups on the MATCHES tab")
+    parser.add_argument("--reject-queries", action="store_true",
+                        help="answer every tq query with 400 to test the client-side fallback")
+    add_fault_args(parser)
+    args = parser.parse_args()
+
+    sheets = make_sheets(args.teams, args.players, args.matchups)
+    app = create_app(sheets, args.reject_queries, latency=args.latency, jitter=args.jitter,
+                     error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                     range_shift=args.range_shift)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
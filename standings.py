@@ -0,0 +1,209 @@
+import logging
+
+from metrics import STANDINGS_MISMATCHES
+from sheets import RowDiff
+from tournament import (
+    GAMES_PER_MATCHUP, MATCHES_SPEC, StandingsTable, TeamRecord, game_from_row, matchup_teams, name_key,
+)
+
+logger = logging.getLogger(__name__)
+
+# Standings folded from game results on the MATCHES tab instead of read from the
+# hand-maintained GROUP_STAGE tab. Every MATCHES row with both scores is one
+# game worth 3 points for a win and 1 for a draw, played by its matchup's teams
+# (tournament.matchup_teams). Only rows that were added, edited or removed since
+# the last refresh are applied, plus the rest of the matchup of an edited row:
+# their old result is taken out of the team totals and the new one added.
+
+TIEBREAKERS = ("gd", "gf", "h2h", "w")  # what may follow points, in any order
+
+
+class _Team:
+    __slots__ = ("name", "rows", "gp", "w", "d", "l", "gf", "ga")
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0  # MATCHES rows played by this team, played or not yet
+        self.gp = self.w = self.d = self.l = self.gf = self.ga = 0
+
+    @property
+    def pts(self):
+        return self.w * 3 + self.d
+
+
+class StandingsEngine:
+    """Team records kept up to date from MATCHES row diffs.
+
+    Add it as a SheetCache listener so each refresh applies just its RowDiff;
+    ``sync`` catches up from whole rows when no diff was seen (e.g. after a
+    restore from disk). ``table`` is a StandingsTable ranked by points and then
+    ``tiebreakers`` (any of TIEBREAKERS); teams still level end up in name order.
+    """
+
+    def __init__(self, cache, sheet_name="MATCHES", tiebreakers=("gd", "gf", "h2h")):
+        unknown = set(tiebreakers) - set(TIEBREAKERS)
+        if unknown:
+            raise ValueError(f"unknown tiebreakers: {', '.join(sorted(unknown))}")
+        self.cache = cache
+        self.sheet_name = sheet_name
+        self.tiebreakers = tuple(tiebreakers)
+        self._rows = None    # the MATCHES rows the totals reflect
+        self._games = []     # per row: (key1, key2, score1, score2), or None without teams
+        self._teams = {}     # name key -> _Team
+        self._pairs = {}     # (key1, key2) with key1 < key2 -> [points of key1, points of key2]
+        self._table = None
+        self._checked = None
+
+    # -------------------- Folding --------------------
+    def __call__(self, sheet_name, diff):
+        if sheet_name != self.sheet_name:
+            return
+        rows = self.cache.rows(sheet_name)
+        if self._rows is None and diff.old_length:
+            self.sync(rows)  # never saw the rows this diff starts from
+            return
+        self.apply(diff, rows)
+
+    def sync(self, rows):
+        if rows is None or rows is self._rows:
+            return
+        self.apply(RowDiff.between(self._rows, rows), rows)
+
+    def apply(self, diff, rows):
+        """Applies the RowDiff that turned the previous rows into ``rows``"""
+        self._apply(diff, rows)
+        self._rows = rows
+
+    def _apply(self, diff, rows):
+        for i in range(diff.length, len(self._games)):
+            self._fold(self._games[i], -1)
+        del self._games[diff.length:]
+        self._games.extend(None for _ in range(diff.length - len(self._games)))
+
+        # Rows that leave the team cells blank take them from the row naming
+        # the matchup, so an edit there can move the next rows' games too
+        touched = set()
+        for i in diff.changed:
+            touched.update(range(i, min(i + GAMES_PER_MATCHUP, diff.length)))
+        for i in sorted(touched):
+            self._fold(self._games[i], -1)
+            game = game_from_row(rows[i], i + MATCHES_SPEC.first_row, matchup_teams(rows, i))
+            entry = None
+            if game.team1 and game.team2:
+                entry = (self._team(game.team1), self._team(game.team2), game.score1, game.score2)
+            self._games[i] = entry
+            self._fold(entry, +1)
+        if diff:
+            self._table = None
+
+    def _team(self, name):
+        key = name_key(name)
+        if key not in self._teams:
+            self._teams[key] = _Team(name)
+        return key
+
+    def _fold(self, entry, sign):
+        """Adds (sign=+1) or takes back (sign=-1) one row's result"""
+        if entry is None:
+            return
+        k1, k2, s1, s2 = entry
+        t1, t2 = self._teams[k1], self._teams[k2]
+        t1.rows += sign
+        t2.rows += sign
+        if s1 is not None and s2 is not None:
+            for team, gf, ga in ((t1, s1, s2), (t2, s2, s1)):
+                team.gp += sign
+                team.gf += sign * gf
+                team.ga += sign * ga
+                if gf > ga:
+                    team.w += sign
+                elif gf == ga:
+                    team.d += sign
+                else:
+                    team.l += sign
+            if k1 > k2:
+                k1, k2, s1, s2 = k2, k1, s2, s1
+            points = self._pairs.setdefault((k1, k2), [0, 0])
+            points[0] += sign * (3 if s1 > s2 else 1 if s1 == s2 else 0)
+            points[1] += sign * (3 if s2 > s1 else 1 if s1 == s2 else 0)
+        for key in {k1, k2}:
+            if self._teams[key].rows == 0:
+                del self._teams[key]
+
+    # -------------------- Ranking --------------------
+    @property
+    def table(self):
+        """StandingsTable of the current totals; the same object until the totals change"""
+        if self._table is None:
+            ranked = self._rank(list(self._teams), ("pts",) + self.tiebreakers)
+            self._table = StandingsTable(self._record(key) for key in ranked)
+        return self._table
+
+    def _record(self, key):
+        t = self._teams[key]
+        return TeamRecord(team=t.name, gp=t.gp, w=t.w, d=t.d, l=t.l,
+                          gf=t.gf, ga=t.ga, gd=t.gf - t.ga, pts=t.pts)
+
+    def _rank(self, keys, criteria):
+        if len(keys) < 2 or not criteria:
+            return sorted(keys)
+        criterion, rest = criteria[0], criteria[1:]
+        if criterion == "h2h":
+            score = self._h2h_points(keys)
+        elif criterion == "gd":
+            score = {k: self._teams[k].gf - self._teams[k].ga for k in keys}
+        else:
+            score = {k: getattr(self._teams[k], criterion) for k in keys}
+
+        # Rank by this criterion; teams level on it are split by the next ones
+        ranked = []
+        level = {}
+        for key in keys:
+            level.setdefault(score[key], []).append(key)
+        for value in sorted(level, reverse=True):
+            ranked.extend(self._rank(level[value], rest))
+        return ranked
+
+    def _h2h_points(self, keys):
+        """Points each team took from games against the other ``keys`` only"""
+        points = dict.fromkeys(keys, 0)
+        ordered = sorted(keys)
+        for i, k1 in enumerate(ordered):
+            for k2 in ordered[i + 1:]:
+                pair = self._pairs.get((k1, k2))
+                if pair:
+                    points[k1] += pair[0]
+                    points[k2] += pair[1]
+        return points
+
+    # -------------------- Consistency --------------------
+    def check(self, sheet_table):
+        """Compares the folded totals with the GROUP_STAGE tab and logs any differences.
+
+        Returns a list of (team, field, from MATCHES, from GROUP_STAGE); the
+        comparison only runs again once either side has changed.
+        """
+        if sheet_table is None:
+            return []
+        table = self.table
+        if self._checked is not None and self._checked[0] is table and self._checked[1] is sheet_table:
+            return self._checked[2]
+
+        mismatches = []
+        for sheet_record in sheet_table.teams:
+            record = table.find(sheet_record.team)
+            if record is None:
+                mismatches.append((sheet_record.team, "team", None, sheet_record.team))
+                continue
+            for field in ("gp", "w", "d", "l", "gf", "ga"):
+                ours, theirs = getattr(record, field), getattr(sheet_record, field)
+                if ours != theirs:
+                    mismatches.append((sheet_record.team, field, ours, theirs))
+
+        self._checked = (table, sheet_table, mismatches)
+        STANDINGS_MISMATCHES.set(len(mismatches))
+        if mismatches:
+            shown = "; ".join(f"{team} {field}: {ours} vs {theirs}" for team, field, ours, theirs in mismatches[:5])
+            logger.warning(f"Standings from MATCHES differ from GROUP_STAGE in {len(mismatches)} places "
+                           f"(MATCHES vs GROUP_STAGE): {shown}")
+        return mismatches
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import marshal
+import os
+import struct
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# File layout: MAGIC, FORMAT_VERSION (unsigned short), then a zlib-compressed
+# marshal dump of {"saved_at": float, "tabs": {sheet_name: {...}}}.
+# Bump FORMAT_VERSION whenever the stored tab layout changes.
+MAGIC = b"BBWCSNAP"
+FORMAT_VERSION = 2
+_HEADER = struct.Struct(f"<{len(MAGIC)}sH")
+
+
+class SnapshotFormatError(Exception):
+    pass
+
+
+def dump_snapshot(tabs):
+    """Encodes {sheet_name: tab state} (see SheetCache.export) to bytes"""
+    body = marshal.dumps({"saved_at": time.time(), "tabs": tabs})
+    return _HEADER.pack(MAGIC, FORMAT_VERSION) + zlib.compress(body, 6)
+
+
+def parse_snapshot(data):
+    """Decodes bytes written by dump_snapshot. Raises SnapshotFormatError on anything else."""
+    if len(data) < _HEADER.size:
+        raise SnapshotFormatError("file is too short")
+    magic, version = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotFormatError("not a snapshot file")
+    if version != FORMAT_VERSION:
+        raise SnapshotFormatError(f"format version {version}, expected {FORMAT_VERSION}")
+    try:
+        return marshal.loads(zlib.decompress(memoryview(data)[_HEADER.size:]))
+    except (zlib.error, ValueError, EOFError, TypeError) as e:
+        raise SnapshotFormatError(f"corrupt snapshot: {e}") from e
+
+
+def write_snapshot(path, tabs):
+    """Atomically replaces the snapshot file, so readers never see a partial write"""
+    data = dump_snapshot(tabs)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def read_snapshot(path):
+    """Returns the decoded snapshot, or None when it is missing or unusable"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Could not read snapshot {path}: {e}")
+        return None
+
+    try:
+        return parse_snapshot(data)
+    except SnapshotFormatError as e:
+        logger.warning(f"Ignoring snapshot {path}: {e}")
+        return None
+
+
+def restore_cache(cache, path):
+    """Loads the saved tabs into the cache. Returns the names of the restored tabs."""
+    snapshot = read_snapshot(path)
+    if snapshot is None:
+        return []
+
+    restored = []
+    for sheet_name, state in snapshot["tabs"].items():
+        try:
+            cache.prime(sheet_name, **state)
+            restored.append(sheet_name)
+        except Exception:
+            logger.exception(f"Could not restore {sheet_name} from snapshot")
+    age = time.time() - snapshot["saved_at"]
+    logger.info(f"Restored {', '.join(restored) or 'nothing'} from {path} ({age:.0f}s old)")
+    return restored
+
+
+class SnapshotSaver:
+    """Cache listener that writes the snapshot to disk shortly after a tab changes.
+
+    Changes arriving within ``delay`` seconds of each other are saved together,
+    and the file is written from a worker thread to keep the event loop free.
+    """
+
+    def __init__(self, cache, path, delay=5):
+        self.cache = cache
+        self.path = path
+        self.delay = delay
+        self._pending = None
+
+    def __call__(self, sheet_name, diff):
+        if self._pending is None or self._pending.done():
+            self._pending = asyncio.ensure_future(self._save_later())
+
+    async def _save_later(self):
+        await asyncio.sleep(self.delay)
+        tabs = self.cache.export()
+        loop = asyncio.get_running_loop()
+        try:
+            size = await loop.run_in_executor(None, write_snapshot, self.path, tabs)
+            logger.info(f"Saved snapshot of {', '.join(tabs)} to {self.path} ({size} bytes)")
+        except OSError as e:
+            logger.warning(f"Could not save snapshot to {self.path}: {e}")
@@ -0,0 +1,82 @@
+import csv
+import random
+from io import StringIO
+
+# Synthetic PLAYERS / GROUP_STAGE / MATCHES tabs in the exact column layout
+# tournament.py reads (see the layout notes there). Used by the benchmarks and
+# the local stand-in sheet server; nothing here talks to Google.
+
+GAMES_PER_MATCHUP = 4
+
+
+def team_name(i):
+    return f"Team{i:03d}"
+
+
+def player_name(team, j):
+    return f"{team} Player{j}"
+
+
+def make_players(teams, players_per_team, rnd):
+    # Three title rows, then the header row (index 3), then one row per player
+    rows = [[""] * 11 for _ in range(3)]
+    rows.append(["", "#", "Players", "", "TEAM", "GP", "", "", "", "G", "A"])
+    for team in teams:
+        for j in range(players_per_team):
+            rows.append([
+                "", str(len(rows) - 3), player_name(team, j), "", team,
+                str(rnd.randint(0, 12)), "", "", "",
+                str(rnd.randint(0, 15)), str(rnd.randint(0, 15)),
+            ])
+    return rows
+
+
+def make_group_stage(teams, rnd):
+    rows = [["", "", "Team", "", "GP", "W", "D", "L", "", "GF", "GA"]]
+    for team in teams:
+        w, d, l = rnd.randint(0, 6), rnd.randint(0, 3), rnd.randint(0, 6)
+        rows.append([
+            "", str(len(rows)), team, "", str(w + d + l), str(w), str(d), str(l), "",
+            str(rnd.randint(0, 40)), str(rnd.randint(0, 40)),
+        ])
+    return rows
+
+
+def make_matches(teams, players_per_team, matchups, rnd):
+    rows = [["", "", "", "Link", "", "Team 1"] + [""] * 10 + ["Team 2"] + [""] * 9 + ["Score 1", "Score 2"]]
+    lineup = min(players_per_team, 3)
+    for m in range(matchups):
+        a = teams[m % len(teams)]
+        b = teams[(m * 7 + 1) % len(teams)]
+        if a == b:
+            b = teams[(m + 1) % len(teams)]
+        for game in range(GAMES_PER_MATCHUP):
+            row = ["", str(len(rows)), "", f"https://youtu.be/match{m}" if game == 0 else "", "", a]
+            for j in range(3):
+                row += [player_name(a, j % lineup), str(rnd.randint(0, 3)), str(rnd.randint(0, 3))]
+            row += ["", b]
+            for j in range(3):
+                row += [player_name(b, j % lineup), str(rnd.randint(0, 3)), str(rnd.randint(0, 3))]
+            row += [str(rnd.randint(0, 6)), str(rnd.randint(0, 6))]
+            rows.append(row)
+    return rows
+
+
+def make_sheets(teams=9, players_per_team=4, matchups=None, seed=2025):
+    """Returns {sheet_name: rows} for a tournament of the given size"""
+    rnd = random.Random(seed)
+    names = [team_name(i) for i in range(teams)]
+    if matchups is None:
+        matchups = teams * 2
+    return {
+        "PLAYERS": make_players(names, players_per_team, rnd),
+        "GROUP_STAGE": make_group_stage(names, rnd),
+        "MATCHES": make_matches(names, players_per_team, matchups, rnd),
+    }
+
+
+def to_csv(rows):
+    """Encodes rows the way the gviz CSV export does (every cell quoted)"""
+    buf = StringIO()
+    csv.writer(buf, quoting=csv.QUOTE_ALL, lineterminator="\n").writerows(rows)
+    return buf.getvalue().encode("utf-8")
@@ -0,0 +1,372 @@
+import heapq
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from analytics import MatchAnalytics
+from fuzzy import FuzzyIndex
+from sheets import TabSpec
+
+# -------------------- Sheet Layout --------------------
+# Every tab is fetched through its TabSpec, so the parsers below only see the
+# declared rows, holding just the declared columns in the declared order.
+# The specs are pushed down to Google as gviz range/tq queries when possible;
+# their labels are the header texts the answer must start with to be trusted.
+
+# PLAYERS: headers on row 4 (index 3), data starts at row 5 (index 4)
+# C: Players (index 2), E: TEAM (index 4), F: GP (index 5), J: G (index 9), K: A (index 10)
+PLAYERS_SPEC = TabSpec(header_row=3, first_row=4, columns=(2, 4, 5, 9, 10), nonempty=(2,),
+                       labels={2: "Players", 4: "TEAM", 5: "GP"})
+P_NAME, P_TEAM, P_GP, P_GOALS, P_ASSISTS = range(5)
+
+# GROUP_STAGE: row 0 has headers, rows 1-9 have the team data
+# C: Team (2), E: GP (4), F: W (5), G: D (6), H: L (7), J: GF (9), K: GA (10)
+STANDINGS_SPEC = TabSpec(header_row=0, first_row=1, last_row=10, columns=(2, 4, 5, 6, 7, 9, 10),
+                         labels={2: "Team", 4: "GP", 9: "GF"})
+S_TEAM, S_GP, S_W, S_D, S_L, S_GF, S_GA = range(7)
+
+# MATCHES: row 0 has headers, every following row is one game
+# D: Link (3), F: Team 1 (5), G-O: Team 1 players as (name, G, A) x3, Q: Team 2 (16),
+# R-Z: Team 2 players, AA/AB: Scores (26/27)
+MATCHES_SPEC = TabSpec(header_row=0, first_row=1, columns=(3, 5, *range(6, 15), 16, *range(17, 26), 26, 27),
+                       labels={5: "Team 1", 16: "Team 2"})
+M_LINK, M_TEAM1, M_LINES1, M_TEAM2, M_LINES2, M_SCORE1, M_SCORE2 = 0, 1, 2, 11, 12, 21, 22
+# A matchup is 4 games: the row naming the two teams and the 3 rows after it
+GAMES_PER_MATCHUP = 4
+
+SPECS = {
+    "PLAYERS": PLAYERS_SPEC,
+    "GROUP_STAGE": STANDINGS_SPEC,
+    "MATCHES": MATCHES_SPEC,
+}
+
+# How many ranks the player leaderboards keep; deeper pages are not served
+LEADERBOARD_DEPTH = 100
+
+
+def _cell(row, idx):
+    value = row[idx] if len(row) > idx else None
+    return value.strip() if value else ""
+
+
+def _int(cell):
+    cell = cell.strip()
+    return int(cell) if cell.isdigit() else 0
+
+
+def _opt_int(cell):
+    """Like _int, but keeps blank cells (e.g. unplayed games) as None"""
+    cell = cell.strip()
+    return int(cell) if cell.isdigit() else None
+
+
+# -------------------- Records --------------------
+@dataclass(frozen=True, slots=True)
+class Player:
+    name: str
+    team: str
+    gp: int
+    goals: int
+    assists: int
+
+
+@dataclass(frozen=True, slots=True)
+class TeamRecord:
+    team: str
+    gp: int
+    w: int
+    d: int
+    l: int
+    gf: int
+    ga: int
+    gd: int
+    pts: int
+
+
+@dataclass(frozen=True, slots=True)
+class GameLine:
+    player: str
+    goals: Optional[int]
+    assists: Optional[int]
+
+
+@dataclass(frozen=True, slots=True)
+class Game:
+    row: int
+    link: str
+    team1: str
+    team2: str
+    lines1: Tuple[GameLine, ...]
+    lines2: Tuple[GameLine, ...]
+    score1: Optional[int]
+    score2: Optional[int]
+    complete: bool
+
+
+def _game_lines(row, start):
+    return tuple(
+        GameLine(_cell(row, col), _opt_int(_cell(row, col + 1)), _opt_int(_cell(row, col + 2)))
+        for col in range(start, start + 9, 3)
+    )
+
+
+# -------------------- Parsed Tabs --------------------
+def name_key(name):
+    """Normalizes a player or team name for case-insensitive lookups"""
+    return name.strip().casefold()
+
+
+def pair_key(team1, team2):
+    """Order-independent key for a matchup between two teams"""
+    return frozenset((name_key(team1), name_key(team2)))
+
+
+def player_from_row(row):
+    """Parses one projected PLAYERS row; None for a row without a name"""
+    name = _cell(row, P_NAME)
+    if not name:
+        return None
+    return Player(
+        name=name,
+        team=_cell(row, P_TEAM),
+        gp=_int(_cell(row, P_GP)),
+        goals=_int(_cell(row, P_GOALS)),
+        assists=_int(_cell(row, P_ASSISTS)),
+    )
+
+
+class PlayersTable:
+    """Every player on the PLAYERS tab, parsed and indexed once per refresh"""
+    __slots__ = ("players", "by_name", "by_team", "top_scorers", "top_assists", "names", "teams")
+
+    def __init__(self, players):
+        self.players = tuple(players)
+
+        # The first row wins when a name appears twice, like the old linear scan
+        self.by_name = {}
+        by_team = {}
+        for p in self.players:
+            self.by_name.setdefault(name_key(p.name), p)
+            by_team.setdefault(name_key(p.team), []).append(p)
+        self.by_team = {team: tuple(members) for team, members in by_team.items()}
+
+        # Fuzzy indexes for prefixes and did-you-mean suggestions
+        self.names = FuzzyIndex((key, p.name) for key, p in self.by_name.items())
+        self.teams = FuzzyIndex((key, members[0].team) for key, members in self.by_team.items())
+
+        # Leaderboards only need the top ranks, so a heap beats a full sort.
+        # Goals DESC, GP ASC (fewer games = higher rank)
+        self.top_scorers = tuple(heapq.nsmallest(
+            LEADERBOARD_DEPTH, self.players, key=lambda p: (-p.goals, p.gp)))
+        # Assists DESC, GP ASC, goals DESC
+        self.top_assists = tuple(heapq.nsmallest(
+            LEADERBOARD_DEPTH, self.players, key=lambda p: (-p.assists, p.gp, -p.goals)))
+
+    def find(self, name):
+        return self.by_name.get(name_key(name))
+
+    def roster(self, team):
+        return self.by_team.get(name_key(team), ())
+
+    def resolve(self, name):
+        """Like find, but also accepts a prefix that matches exactly one player"""
+        key = name_key(name)
+        player = self.by_name.get(key)
+        if player is None:
+            key = self.names.resolve(key)
+            player = self.by_name.get(key) if key else None
+        return player
+
+    def resolve_team(self, team):
+        """The team's name as written on the sheet, for an exact name or unique prefix"""
+        key = name_key(team)
+        if key not in self.by_team:
+            key = self.teams.resolve(key)
+        return self.by_team[key][0].team if key else None
+
+    def suggest(self, name, limit=3):
+        return self.names.suggest(name_key(name), limit)
+
+    def suggest_team(self, team, limit=3):
+        return self.teams.suggest(name_key(team), limit)
+
+    @classmethod
+    def from_rows(cls, rows):
+        players = (player_from_row(row) for row in rows)
+        return cls(p for p in players if p is not None)
+
+
+class StandingsTable:
+    """Team records, from the GROUP_STAGE tab or folded from MATCHES, with GD/PTS precomputed"""
+    __slots__ = ("teams", "by_team", "ranked")
+
+    def __init__(self, teams):
+        self.teams = tuple(teams)
+        self.by_team = {}
+        for t in self.teams:
+            self.by_team.setdefault(name_key(t.team), t)
+
+        # Every team is shown, so this one is a full sort by PTS descending
+        self.ranked = tuple(sorted(self.teams, key=lambda t: t.pts, reverse=True))
+
+    def find(self, team):
+        return self.by_team.get(name_key(team))
+
+    @classmethod
+    def from_rows(cls, rows):
+        teams = []
+        for row in rows:
+            if row[S_GA] is None:  # Source row too short to reach GA (column K)
+                continue
+            name = row[S_TEAM].strip()
+            if not name or name.startswith("Table"):  # Skip any "Table..." rows
+                continue
+            w, d = _int(row[S_W]), _int(row[S_D])
+            gf, ga = _int(row[S_GF]), _int(row[S_GA])
+            teams.append(TeamRecord(
+                team=name,
+                gp=_int(row[S_GP]),
+                w=w,
+                d=d,
+                l=_int(row[S_L]),
+                gf=gf,
+                ga=ga,
+                gd=gf - ga,
+                pts=(w * 3) + d,
+            ))
+        return cls(teams)
+
+
+def _row_teams(row):
+    if len(row) <= M_TEAM2 or row[M_TEAM2] is None:  # source row does not reach column Q
+        return "", ""
+    return _cell(row, M_TEAM1), _cell(row, M_TEAM2)
+
+
+def matchup_teams(rows, i):
+    """(team1, team2) that projected MATCHES row ``i`` is played under.
+
+    A matchup is the row naming its teams plus the GAMES_PER_MATCHUP - 1 rows
+    after it (see $matchinfo), and those rows may leave the team cells blank.
+    ("", "") for a blank row that belongs to no matchup.
+    """
+    for j in range(i, max(i - GAMES_PER_MATCHUP, -1), -1):
+        teams = _row_teams(rows[j])
+        if teams[0] or teams[1]:
+            return teams
+    return "", ""
+
+
+def game_from_row(row, row_number, teams=None):
+    """Parses one projected MATCHES row; ``row_number`` is its 0-based row on the sheet.
+
+    ``teams`` (see matchup_teams) replaces the row's own team cells.
+    """
+    team1, team2 = teams if teams is not None else _row_teams(row)
+    return Game(
+        row=row_number,
+        link=_cell(row, M_LINK),
+        team1=team1,
+        team2=team2,
+        lines1=_game_lines(row, M_LINES1),
+        lines2=_game_lines(row, M_LINES2),
+        score1=_opt_int(_cell(row, M_SCORE1)),
+        score2=_opt_int(_cell(row, M_SCORE2)),
+        complete=row[M_SCORE2] is not None,  # source row reaches column AB
+    )
+
+
+class MatchesTable:
+    """One Game per MATCHES row, under its matchup's teams; games[i] is sheet row i + 1"""
+    __slots__ = ("games", "by_pair", "analytics")
+
+    def __init__(self, games):
+        self.games = tuple(games)
+
+        # Unordered team pair -> positions in games, in sheet order
+        by_pair = {}
+        for i, game in enumerate(self.games):
+            if game.team1 or game.team2:
+                by_pair.setdefault(pair_key(game.team1, game.team2), []).append(i)
+        self.by_pair = {pair: tuple(positions) for pair, positions in by_pair.items()}
+
+        # Derived per-player/per-team stats for $stats and $h2h
+        self.analytics = MatchAnalytics(self.games, name_key)
+
+    def find(self, team1, team2):
+        """Positions in games of every row where the two teams meet"""
+        return self.by_pair.get(pair_key(team1, team2), ())
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls(
+            game_from_row(row, i + MATCHES_SPEC.first_row, matchup_teams(rows, i))
+            for i, row in enumerate(rows)
+        )
+
+
+# Turns each tab's projected rows into its parsed table
+PARSERS = {
+    "PLAYERS": PlayersTable.from_rows,
+    "GROUP_STAGE": StandingsTable.from_rows,
+    "MATCHES": MatchesTable.from_rows,
+}
+
+
+# -------------------- Snapshot --------------------
+class Snapshot:
+    """One consistent view of every parsed tab.
+
+    A new Snapshot (with a higher version) is created whenever any tab has been
+    re-parsed; tabs that have not been loaded yet are None.
+    """
+    __slots__ = ("players", "standings", "matches", "version")
+
+    def __init__(self, players, standings, matches, version):
+        self.players = players
+        self.standings = standings
+        self.matches = matches
+        self.version = version
+
+
+class TournamentData:
+    """Hands commands the current Snapshot built from the cached tabs.
+
+    With a StandingsEngine, ``Snapshot.standings`` is computed from MATCHES
+    (and checked against GROUP_STAGE) instead of read from GROUP_STAGE.
+    """
+
+    def __init__(self, cache, standings=None):
+        self.cache = cache
+        self.standings = standings
+        self._snapshot = Snapshot(None, None, None, version=0)
+
+    @property
+    def standings_tab(self):
+        """The tab the standings are built from"""
+        return "GROUP_STAGE" if self.standings is None else self.standings.sheet_name
+
+    async def snapshot(self, *sheet_names):
+        """Make sure the given tabs are loaded, then return the current Snapshot.
+
+        The tabs are fetched concurrently and the Snapshot is taken in one step
+        afterwards, so a command never mixes tables from two refreshes.
+        """
+        await self.cache.get_many(sheet_names)
+        return self.current()
+
+    def current(self):
+        snap = self._snapshot
+        players = self.cache.peek("PLAYERS")
+        matches = self.cache.peek("MATCHES")
+        if self.standings is None:
+            standings = self.cache.peek("GROUP_STAGE")
+        elif matches is None:
+            standings = None
+        else:
+            self.standings.sync(self.cache.rows(self.standings.sheet_name))
+            standings = self.standings.table
+            self.standings.check(self.cache.peek("GROUP_STAGE"))
+        if players is not snap.players or standings is not snap.standings or matches is not snap.matches:
+            snap = Snapshot(players, standings, matches, snap.version + 1)
+            self._snapshot = snap
+        return snap